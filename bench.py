@@ -0,0 +1,95 @@
+"""
+Benchmarks for conversion paths, run against a synthetic rate table so no
+network access is needed.
+
+Usage:
+    python bench.py
+"""
+
+from array import array
+import json
+import random
+import time
+
+import currencyconsts as cc
+from currencyconsts import *
+
+
+def install_synthetic_rates():
+    """Publish a made-up rate table for every code in CURRENCY_CODES."""
+    rng = random.Random(0)
+    rates = {code: rng.uniform(0.1, 1000) for code in CURRENCY_CODES}
+    rates[cc._config['base_currency']] = 1.0
+    with cc._lock:
+        cc._publish(rates, cc._config['base_currency'], time.time())
+
+
+def timed(label, fn, rows, unit='rows'):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:32s} {elapsed * 1000:>9.2f} ms  {rows / elapsed:>14,.0f} {unit}/s")
+    return elapsed
+
+
+def bench_batch_conversion(rows=1_000_000):
+    """Compare the per-item operator loop with convert_many/convert_many_pairs."""
+    print("=" * 60)
+    print(f"BATCH CONVERSION ({rows:,} rows)")
+    print("=" * 60)
+    
+    amounts = array('d', (random.uniform(1, 1000) for _ in range(rows)))
+    codes = [random.choice(CURRENCY_CODES) for _ in range(rows)]
+    
+    loop = timed("loop: amount * EUR", lambda: [amount * EUR for amount in amounts], rows)
+    many = timed("convert_many(amounts, 'EUR')", lambda: convert_many(amounts, 'EUR'), rows)
+    print(f"  speedup: {loop / many:.1f}x")
+    
+    print()
+    loop = timed("loop: amount / X * EUR", lambda: [
+        amount / cc.Currency(code).rate * EUR for amount, code in zip(amounts, codes)
+    ], rows)
+    pairs = timed("convert_many_pairs", lambda: convert_many_pairs(amounts, codes, 'EUR'), rows)
+    print(f"  speedup: {loop / pairs:.1f}x")
+
+
+def bench_refresh_parse(refreshes=20_000):
+    """Time decoding and parsing a rate payload, the CPU cost of each refresh."""
+    print("=" * 60)
+    print(f"REFRESH PARSE ({refreshes:,} refreshes, {len(ISO_4217_CODES)} rates)")
+    print("=" * 60)
+    
+    rng = random.Random(0)
+    payload = json.dumps({
+        'result': 'success',
+        'base_code': 'USD',
+        'time_next_update_unix': int(time.time()) + 86400,
+        'rates': {code: rng.uniform(0.1, 1000) for code in ISO_4217_CODES},
+    }).encode()
+    
+    def parse(loads):
+        for _ in range(refreshes):
+            cc._parse_api_response(loads(payload), 'usd', '')
+    
+    def rebuild(loads):
+        # What every refresh did before: decode with json, copy with upper case keys
+        for _ in range(refreshes):
+            data = loads(payload)
+            {k.upper(): v for k, v in data['rates'].items()}
+    
+    baseline = timed("json + rebuilt keys", lambda: rebuild(json.loads), refreshes, 'refreshes')
+    print(f"  {baseline / refreshes * 1e6:.1f} us per refresh")
+    decoders = [('json', json.loads)]
+    fastest = cc._get_json_loads()
+    if fastest is not json.loads:
+        decoders.append((fastest.__module__ or 'fast', fastest))
+    for name, loads in decoders:
+        elapsed = timed(f"{name} + _parse_api_response", lambda: parse(loads), refreshes, 'refreshes')
+        print(f"  {elapsed / refreshes * 1e6:.1f} us per refresh, speedup: {baseline / elapsed:.1f}x")
+
+
+if __name__ == '__main__':
+    install_synthetic_rates()
+    bench_batch_conversion()
+    print()
+    bench_refresh_parse()
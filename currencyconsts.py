@@ -20,79 +20,465 @@ Usage:
     eur.inverse    # Inverse rate (1/rate)
 """
 
-import requests
-from datetime import datetime, timedelta
-from typing import Union
+from typing import NamedTuple, Optional, Union
+from collections import OrderedDict, deque
+from decimal import Decimal, ROUND_HALF_EVEN
+from array import array
+import csv
+import itertools
+import json
+import os
+import random
+import sys
 import threading
+import time
+import warnings
+
+# requests, asyncio, concurrent.futures, multiprocessing and tempfile are
+# imported where they are used so importing this module stays cheap.
+
+__all__ = [
+    'Currency', 'Money', 'CURRENCY_CODES', 'ISO_4217_CODES',
+    'set_money_mode', 'set_decimal_mode', 'sum_money', 'total_by_currency', 'money_from_amounts',
+    'set_base', 'set_margin', 'set_cache_ttl', 'set_cache_size', 'set_stale_while_revalidate',
+    'set_offline_mode', 'set_disk_cache', 'save_snapshot', 'load_snapshot', 'set_session', 'set_http_options',
+    'set_fetch_mode', 'set_circuit_breaker', 'set_json_decoder',
+    'fetch_stats', 'endpoint_stats', 'rate_status', 'refresh_rates', 'cross_rate', 'cross_rate_matrix',
+    'aget_rates', 'aconvert', 'arefresh_rates',
+    'convert_array', 'convert_many', 'convert_many_pairs',
+    'convert_stream', 'convert_csv', 'convert_jsonl', 'register_pandas_accessor',
+]
 
 # ============================================================================
 # Configuration
 # ============================================================================
 
 _config = {
-    'base_currency': 'usd',
+    'base_currency': 'USD',
+    'pivot_currency': 'USD',  # Fetch this table only and derive other bases (None to fetch each)
     'margin_percent': 0,  # Markup percentage (e.g., 3.5 for PayPal-like rates)
+    'sell_margin_percent': 0,  # Markup when converting back to the base (100 / EUR)
+    'currency_margins': {},  # Code -> (buy, sell) margin overrides, None inherits
     'cache_ttl_minutes': 60,
+    'cache_max_bases': 8,  # Rate tables kept for recently used base currencies
+    'honor_provider_expiry': True,  # Keep rates until the provider's next update if later than the TTL
+    'conditional_requests': True,  # Revalidate with ETag/Last-Modified instead of downloading again
+    'stale_while_revalidate': False,  # Serve expired rates while refreshing in background
+    'hard_expiry_minutes': 24 * 60,  # Past this age, callers block on a refresh
     'offline_mode': False,  # Force use of fallback rates
+    'money_results': False,  # Return Money instead of float from 100 * EUR and 100 / EUR
+    'decimal_rates': False,  # Parse rates as Decimal to keep the API's exact digits
+    'disk_cache_dir': None,  # Directory to persist fetched rates across processes
+    'http_timeout': 10,  # Seconds per request
+    'http_pool_size': 10,  # Keep-alive connections kept per host
+    'http_retries': 0,  # Transport-level retries per request
+    'fetch_mode': 'sequential',  # How api_endpoints are tried: 'sequential', 'race' or 'hedged'
+    'hedge_delay': 0.5,  # Seconds before a hedged fetch also tries the next endpoint
+    'breaker_threshold': 3,  # Consecutive failures before an endpoint is skipped
+    'breaker_backoff': 5,  # Seconds an endpoint is first skipped for, doubling each time
+    'breaker_max_backoff': 600,  # Longest an endpoint is skipped for
+    'adaptive_endpoints': True,  # Try endpoints by observed latency and errors rather than in order
     'api_endpoints': [
         # ExchangeRate-API Open Access (no key required)
         'https://open.er-api.com/v6/latest/{BASE}',
     ],
 }
 
-_cache = {
-    'rates': {},
-    'last_fetch': None,
-    'base': None,
-    'using_fallback': False,
-}
+# Parsed _FALLBACK_RATES, loaded on first use
+_fallback_table = None
 
+# Whether a failed fetch has warned about falling back to _FALLBACK_RATES
+_fallback_warned = False
+
+# Guards publishing snapshots, never held by readers or during network I/O
 _lock = threading.Lock()
 
 
+class _RateSnapshot(NamedTuple):
+    """Immutable exchange rate table, swapped in whole on every refresh."""
+    version: int
+    base: str
+    rates: dict
+    fetched_at: float
+    expires_at: float
+    derived: dict  # Lazily computed views of rates, e.g. the cross rate matrix
+    fallback: bool = False  # Whether rates come from the bundled _FALLBACK_RATES
+    held_until: float = 0.0  # Earliest expiry, set by the provider or an outage, kept by set_cache_ttl
+
+
+# Always the snapshot for the current base currency, or None
+_snapshot: Optional[_RateSnapshot] = None
+
+# Base currency -> snapshot, least recently used first. Guarded by _lock.
+_snapshots: 'OrderedDict[str, _RateSnapshot]' = OrderedDict()
+_versions = itertools.count(1)
+
+# Identifies the current margin settings, see _margin_tables
+_margin_key = (0, 0, ())
+
+# Expiry of snapshots loaded with load_snapshot(), which are never refreshed
+_PINNED = float('inf')
+
+class _SingleFlight:
+    """Run at most one call per key at a time, sharing its outcome with concurrent callers."""
+    
+    class _Call:
+        __slots__ = ('done', 'result', 'error')
+        
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {'calls': 0, 'executions': 0, 'coalesced': 0}
+    
+    def do(self, key, fn, *args):
+        with self._lock:
+            self.stats['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+                self.stats['executions'] += 1
+            else:
+                self.stats['coalesced'] += 1
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+# One fetch in flight per base currency
+_flights = _SingleFlight()
+
+class _CircuitBreaker:
+    """
+    Failure tracking and request statistics for one endpoint.
+    
+    Closed, requests pass and consecutive failures are counted. After
+    breaker_threshold of them it opens and the endpoint is skipped for an
+    exponentially growing, jittered backoff. Then it is half-open: a single
+    trial request passes, closing it on success or reopening it on failure.
+    All methods must be called with _breaker_lock held.
+    """
+    __slots__ = ('state', 'failures', 'opened', 'retry_at', 'requests', 'errors', 'latency', 'error_rate')
+    
+    # Weight of the newest request in the moving averages
+    ALPHA = 0.2
+    
+    def __init__(self):
+        self.state = 'closed'
+        self.failures = 0  # Consecutive failed requests
+        self.opened = 0  # Consecutive times opened, sets the backoff
+        self.retry_at = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.latency = None  # Moving average of successful request seconds
+        self.error_rate = 0.0  # Moving average of the failed fraction
+    
+    def cost(self) -> float:
+        """Expected seconds to get rates from this endpoint, counting failures at the timeout."""
+        # Untried endpoints cost nothing, so they are tried and measured
+        return (self.latency or 0.0) + self.error_rate * _config['http_timeout']
+    
+    def available(self, now: float) -> bool:
+        """Whether a request would be let through."""
+        return self.state == 'closed' or (self.state == 'open' and now >= self.retry_at)
+    
+    def allow(self, now: float) -> bool:
+        """Let a request through if available, claiming the half-open trial."""
+        if not self.available(now):
+            return False
+        if self.state == 'open':
+            self.state = 'half_open'
+        return True
+    
+    def record(self, ok: bool, now: float, elapsed: float):
+        self.requests += 1
+        self.error_rate += self.ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.latency = elapsed if self.latency is None else self.latency + self.ALPHA * (elapsed - self.latency)
+            self.state, self.failures, self.opened = 'closed', 0, 0
+            return
+        self.errors += 1
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= _config['breaker_threshold']:
+            self.opened += 1
+            delay = min(_config['breaker_backoff'] * 2 ** min(self.opened - 1, 32), _config['breaker_max_backoff'])
+            # Jitter spreads retries from many processes hitting the same outage
+            self.state, self.retry_at = 'open', now + delay * random.uniform(0.5, 1)
+
+
+# Endpoint template -> _CircuitBreaker, guarded by _breaker_lock
+_breakers = {}
+_breaker_lock = threading.Lock()
+
+class _Validated(NamedTuple):
+    """Rates last downloaded from a URL, with what is needed to revalidate them."""
+    etag: Optional[str]
+    last_modified: Optional[str]
+    decimal: bool  # Whether rates were parsed in decimal mode
+    rates: dict
+    next_update: Optional[float]  # Provider's next update time from the payload
+
+
+# Decodes API response bytes, picked by _get_json_loads on first use
+_json_loads = None
+
+# URL -> _Validated, entries are replaced whole so reads need no lock
+_validated = {}
+
+# Held for the lifetime of the background refresh thread, if any
+_background_lock = threading.Lock()
+
+# Shared HTTP session reused by every fetch, created on first use
+_session = None
+_session_lock = threading.Lock()
+# Whether _session was installed by set_session(), so it is not ours to replace
+_session_custom = False
+
+
 # ============================================================================
 # API Functions
 # ============================================================================
 
+def _make_session():
+    """Create a requests session with a keep-alive connection pool."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=_config['http_pool_size'],
+        pool_maxsize=_config['http_pool_size'],
+        max_retries=_config['http_retries'],
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _get_session():
+    """Get the shared HTTP session, creating it on first use."""
+    global _session
+    session = _session
+    if session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _make_session()
+            session = _session
+    return session
+
+
+def _get_json_loads():
+    """Get the decoder for API responses, the fastest installed unless set_json_decoder() chose one."""
+    global _json_loads
+    if _json_loads is None:
+        try:
+            import orjson
+            _json_loads = orjson.loads
+        except ImportError:
+            try:
+                import ujson
+                _json_loads = ujson.loads
+            except ImportError:
+                _json_loads = json.loads
+    return _json_loads
+
+
+def _upper_keys(rates: dict) -> dict:
+    """Get rates keyed by upper case codes, reusing the dict if they already are."""
+    if all(map(str.isupper, rates)):
+        return rates
+    return {k.upper(): v for k, v in rates.items()}
+
+
 def _parse_api_response(data: dict, base: str, url: str) -> dict:
     """Parse response from different API formats."""
     base_lower = base.lower()
-    base_upper = base.upper()
     
     # Format 1: ExchangeRate-API format {"rates": {...}}
     if 'rates' in data:
-        return {k.upper(): v for k, v in data['rates'].items()}
+        return _upper_keys(data['rates'])
     
     # Format 2: Fawazahmed0 format {"usd": {...}}
     if base_lower in data:
-        return {k.upper(): v for k, v in data[base_lower].items()}
+        return _upper_keys(data[base_lower])
     
     # Format 3: Direct rates dict
-    if isinstance(data, dict) and all(isinstance(v, (int, float)) for v in data.values()):
-        return {k.upper(): v for k, v in data.items()}
+    if isinstance(data, dict) and all(isinstance(v, (int, float, Decimal)) for v in data.values()):
+        return _upper_keys(data)
     
     return {}
 
 
-def _fetch_rates(base: str) -> dict:
-    """Fetch exchange rates from multiple API sources with fallback."""
-    base_lower = base.lower()
-    base_upper = base.upper()    
+def _breaker(endpoint_template: str) -> _CircuitBreaker:
+    """Get the circuit breaker for an endpoint. Caller must hold _breaker_lock."""
+    breaker = _breakers.get(endpoint_template)
+    if breaker is None:
+        breaker = _breakers[endpoint_template] = _CircuitBreaker()
+    return breaker
+
+
+def _provider_expiry(headers, next_update: Optional[float]) -> Optional[float]:
+    """When the provider says its rates may change, from Cache-Control or the payload."""
+    expiry = next_update
+    for directive in headers.get('Cache-Control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        name = name.lower()
+        if name in ('no-cache', 'no-store'):
+            return None
+        if name == 'max-age':
+            try:
+                max_age_expiry = time.time() + int(value) - int(headers.get('Age', 0))
+            except ValueError:
+                continue
+            expiry = max(expiry or 0, max_age_expiry)
+    return expiry
+
+
+def _fetch_endpoint(endpoint_template: str, base: str) -> tuple:
+    """
+    Fetch and parse (rates, expires_at) from a single endpoint, raising on failure.
+    
+    expires_at is when the provider says the rates may change, or None.
+    Rates fetched from the URL before are revalidated with a conditional
+    request, and reused without a download when unchanged (304).
+    """
+    with _breaker_lock:
+        if not _breaker(endpoint_template).allow(time.time()):
+            raise ConnectionError("circuit open, endpoint is backing off")
+    
+    ok = False
+    started = time.perf_counter()
+    try:
+        # Handle different URL formats
+        url = endpoint_template.format(base=base.lower(), BASE=base.upper())
+        decimal = _config['decimal_rates']
+        validated = _validated.get(url) if _config['conditional_requests'] else None
+        if validated is not None and validated.decimal != decimal:
+            validated = None
+        headers = {}
+        if validated is not None:
+            if validated.etag:
+                headers['If-None-Match'] = validated.etag
+            if validated.last_modified:
+                headers['If-Modified-Since'] = validated.last_modified
+        
+        response = _get_session().get(url, timeout=_config['http_timeout'], headers=headers)
+        if response.status_code == 304 and validated is not None:
+            # Unchanged, skip downloading and parsing the table again
+            rates, next_update = validated.rates, validated.next_update
+        else:
+            response.raise_for_status()
+            if decimal:
+                data = json.loads(response.content, parse_float=Decimal)
+            else:
+                data = _get_json_loads()(response.content)
+            
+            rates = _parse_api_response(data, base.lower(), url)
+            if not rates:
+                raise ValueError("response contained no rates")
+            next_update = data.get('time_next_update_unix')
+            etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+            if etag or last_modified:
+                _validated[url] = _Validated(etag, last_modified, decimal, rates, next_update)
+            else:
+                _validated.pop(url, None)
+        ok = True
+        return rates, _provider_expiry(response.headers, next_update)
+    finally:
+        elapsed = time.perf_counter() - started
+        with _breaker_lock:
+            _breaker(endpoint_template).record(ok, time.time(), elapsed)
+
+
+def _fetch_concurrent(endpoints: list, base: str, hedge_delay: Optional[float]) -> tuple:
+    """
+    Query endpoints in parallel and return the first valid (rates, expires_at).
+    
+    With hedge_delay None all endpoints are raced at once, otherwise the next
+    endpoint is only started once the running ones have been pending for
+    hedge_delay seconds or have failed.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    
+    queued = list(endpoints)
+    running = {}
+    errors = []
+    executor = ThreadPoolExecutor(max_workers=len(queued), thread_name_prefix='currencyconsts-fetch')
+    
+    def launch():
+        template = queued.pop(0)
+        running[executor.submit(_fetch_endpoint, template, base)] = template
+    
+    try:
+        while queued or running:
+            while queued and (hedge_delay is None or not running):
+                launch()
+            
+            done, _ = wait(running, timeout=hedge_delay if queued else None, return_when=FIRST_COMPLETED)
+            if not done:
+                # Running requests are slow, hedge with the next endpoint
+                launch()
+                continue
+            
+            for future in done:
+                template = running.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    errors.append(f"{template}: {e}")
+                    # Replace a failed request straight away rather than after the delay
+                    if queued:
+                        launch()
+    finally:
+        # Losers can't be interrupted mid-request, their results are discarded
+        for future in running:
+            future.cancel()
+        executor.shutdown(wait=False)
+    
+    raise ConnectionError(f"Could not fetch live rates from any API. Errors: {errors}")
+
+
+def _fetch_rates(base: str) -> tuple:
+    """Fetch (rates, expires_at) from multiple API sources with fallback, see _fetch_endpoint."""
+    now = time.time()
+    with _breaker_lock:
+        endpoints = [template for template in _config['api_endpoints'] if _breaker(template).available(now)]
+        if _config['adaptive_endpoints']:
+            # Cheapest first, ties keep the configured order
+            endpoints.sort(key=lambda template: _breakers[template].cost())
+    if not endpoints:
+        # Fail in microseconds rather than waiting on endpoints known to be down
+        raise ConnectionError("Could not fetch live rates from any API. Errors: every endpoint is backing off")
+    
+    mode = _config['fetch_mode']
+    if mode != 'sequential' and len(endpoints) > 1:
+        return _fetch_concurrent(endpoints, base, None if mode == 'race' else _config['hedge_delay'])
+    
     errors = []
     
     # Try each API endpoint
-    for endpoint_template in _config['api_endpoints']:
+    for endpoint_template in endpoints:
         try:
-            # Handle different URL formats
-            url = endpoint_template.format(base=base_lower, BASE=base_upper)
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            rates = _parse_api_response(data, base_lower, url)
-            if rates:
-                return rates
-                
+            return _fetch_endpoint(endpoint_template, base)
         except Exception as e:
             errors.append(f"{endpoint_template}: {e}")
             continue
@@ -100,34 +486,368 @@ def _fetch_rates(base: str) -> dict:
     raise ConnectionError(f"Could not fetch live rates from any API. Errors: {errors}")
 
 
+def _disk_cache_path(base: str) -> Optional[str]:
+    cache_dir = _config['disk_cache_dir']
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, f"rates-{base}.json")
+
+
+def _read_disk_cache(base: str) -> Optional[tuple]:
+    """Load (rates, fetched_at, held_until, None) for base from disk if still fresh."""
+    path = _disk_cache_path(base)
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            data = json.load(f)
+        rates, fetched_at, held_until = data['rates'], data['fetched_at'], data.get('expires_at')
+        expires_at = max(fetched_at + _config['cache_ttl_minutes'] * 60, held_until or 0)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if time.time() >= expires_at:
+        return None
+    return rates, fetched_at, held_until, None
+
+
+def _write_rates_file(path: str, base: str, rates: dict, fetched_at: float,
+                     expires_at: Optional[float] = None):
+    """Atomically replace a rates file, so readers never see a partial write."""
+    import tempfile
+    
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        data = {'base': base, 'fetched_at': fetched_at, 'rates': rates}
+        if expires_at is not None:
+            data['expires_at'] = expires_at
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _write_disk_cache(base: str, rates: dict, fetched_at: float, held_until: Optional[float]):
+    """Atomically replace the on-disk rates for base. Failures are ignored."""
+    path = _disk_cache_path(base)
+    if path is None:
+        return
+    try:
+        _write_rates_file(path, base, rates, fetched_at, held_until)
+    except OSError:
+        pass
+
+
+def _load_rates(base: str, force: bool = False) -> tuple:
+    """
+    Get (rates, fetched_at, held_until, decimal_rates) for base from disk or
+    the network, or None in offline mode without a cached table.
+    
+    held_until is the provider's next update if rates should be kept until
+    then, else None. decimal_rates holds the exact parsed values in decimal
+    mode, else None.
+    """
+    if not force:
+        cached = _read_disk_cache(base)
+        if cached is not None:
+            return cached
+    if _config['offline_mode']:
+        return None
+    rates, provider_expiry = _fetch_rates(base)
+    
+    decimal_rates = None
+    if _config['decimal_rates']:
+        decimal_rates = {code: Decimal(rate) for code, rate in rates.items()}
+        rates = {code: float(rate) for code, rate in rates.items()}
+    fetched_at = time.time()
+    # Refetching before the provider updates would download the same rates
+    held_until = provider_expiry if _config['honor_provider_expiry'] else None
+    _write_disk_cache(base, rates, fetched_at, held_until)
+    return rates, fetched_at, held_until, decimal_rates
+
+
+def _fallback_rates(base: str) -> Optional[dict]:
+    """Get rates for base from the bundled fallback table, if it has base."""
+    global _fallback_table
+    if _fallback_table is None:
+        _fallback_table = {
+            code: float(rate)
+            for code, rate in (entry.split(':') for entry in _FALLBACK_RATES.split())
+        }
+    return _cross_rates(_fallback_table, base)
+
+
+def _cross_rates(rates: dict, base: str) -> Optional[dict]:
+    """Rebase a rate table onto another currency it contains."""
+    divisor = rates.get(base)
+    if not divisor:
+        return None
+    cross = {code: rate / divisor for code, rate in rates.items()}
+    cross[base] = divisor / divisor  # Exactly one, as float or Decimal like the table
+    return cross
+
+
+def _margin_tables(snap: _RateSnapshot) -> tuple:
+    """
+    Get (buy, sell) rate tables for a snapshot with margins applied.
+    
+    buy[code] converts one base unit into code, sell[code] is the divisor
+    converting code back into the base. Built once per rate table and
+    margin settings, so conversions are a single lookup.
+    """
+    key = ('margins', _margin_key)
+    tables = snap.derived.get(key)
+    if tables is None:
+        tables = snap.derived[key] = _apply_margins(snap.rates, float)
+    return tables
+
+
+def _pair_tables(snap: _RateSnapshot) -> tuple:
+    """
+    Get (base, buy, sell) tables for converting between any two currencies.
+    
+    Converting from X to Y multiplies by buy[Y] / sell[X], which matches
+    100 * EUR and 100 / EUR when either side is the base. The base itself
+    carries no margin, so only the non-base sides are charged.
+    """
+    key = ('pair_tables', _margin_key)
+    tables = snap.derived.get(key)
+    if tables is None:
+        buy, sell = (dict(table) for table in _margin_tables(snap))
+        buy[snap.base] = sell[snap.base] = snap.rates.get(snap.base, 1.0)
+        tables = snap.derived[key] = (snap.base, buy, sell)
+    return tables
+
+
+def _decimal_tables(snap: _RateSnapshot) -> tuple:
+    """
+    Get (rates, buy, sell) Decimal tables for a snapshot, like _margin_tables.
+    
+    Uses the exact parsed values in decimal mode. Otherwise each float is
+    converted through its shortest repr, which recovers the API's digits.
+    """
+    key = ('decimal_margins', _margin_key)
+    tables = snap.derived.get(key)
+    if tables is None:
+        rates = snap.derived.get('decimal_rates')
+        if rates is None:
+            rates = snap.derived['decimal_rates'] = {code: Decimal(repr(rate)) for code, rate in snap.rates.items()}
+        tables = snap.derived[key] = (rates,) + _apply_margins(rates, lambda n: Decimal(str(n)))
+    return tables
+
+
+def _apply_margins(rates: dict, number) -> tuple:
+    """Build (buy, sell) tables from rates, with number() converting margins."""
+    buy_margin, sell_margin, overrides = _margin_key
+    overrides = dict(overrides)
+    one, hundred = number(1), number(100)
+    buy, sell = {}, {}
+    for code, rate in rates.items():
+        code_buy, code_sell = overrides.get(code, (None, None))
+        code_buy = buy_margin if code_buy is None else code_buy
+        code_sell = sell_margin if code_sell is None else code_sell
+        # Margin reduces what you get (like PayPal)
+        buy[code] = rate * (one - number(code_buy) / hundred) if code_buy > 0 else rate
+        sell[code] = rate / (one - number(code_sell) / hundred) if code_sell > 0 else rate
+    return buy, sell
+
+
+def _publish(rates: dict, base: str, fetched_at: float, held_until: Optional[float] = None,
+             decimal_rates: Optional[dict] = None, fallback: bool = False) -> _RateSnapshot:
+    """
+    Publish a new snapshot for readers, expiring after the TTL or at
+    held_until if that is later. Caller must hold _lock.
+    """
+    held_until = held_until or 0.0
+    expires_at = max(fetched_at + _config['cache_ttl_minutes'] * 60, held_until)
+    snap = _RateSnapshot(next(_versions), base, rates, fetched_at, expires_at, {}, fallback, held_until)
+    if decimal_rates is not None:
+        snap.derived['decimal_rates'] = decimal_rates
+    return _store(snap)
+
+
+def _store(snap: _RateSnapshot) -> _RateSnapshot:
+    """Cache a snapshot and make it current if it is for the base. Caller must hold _lock."""
+    global _snapshot
+    base = snap.base
+    _snapshots[base] = snap
+    _snapshots.move_to_end(base)
+    while len(_snapshots) > _config['cache_max_bases']:
+        _snapshots.popitem(last=False)
+    
+    if base == _config['base_currency']:
+        _snapshot = snap
+    return snap
+
+
+def _renew_versions(stale_key: Optional[tuple] = None):
+    """
+    Give every cached snapshot a new version, so values derived from the
+    config (like Currency rate slots) are recomputed. Caller must hold _lock.
+    
+    Derived tables whose key ends with stale_key are dropped, so pinned
+    snapshots don't keep tables for old margins alive.
+    """
+    global _snapshot
+    for base, snap in _snapshots.items():
+        _snapshots[base] = snap._replace(version=next(_versions))
+    if _snapshot is not None:
+        _snapshot = _snapshots.get(_snapshot.base) or _snapshot._replace(version=next(_versions))
+    if stale_key is not None:
+        for snap in [*_snapshots.values(), _snapshot]:
+            # Copy the keys first, readers may add tables meanwhile
+            for key in list(snap.derived) if snap is not None else ():
+                if isinstance(key, tuple) and key[-1] == stale_key:
+                    snap.derived.pop(key, None)
+
+
+def _fetch_snapshot(base: str, force: bool) -> _RateSnapshot:
+    """Fetch and publish rates for base. Run through _flights."""
+    try:
+        loaded = _load_rates(base, force)
+    except ConnectionError as e:
+        return _publish_failure(base, e)
+    if loaded is None:
+        return _publish_fallback(base)
+    rates, fetched_at, held_until, decimal_rates = loaded
+    with _lock:
+        return _publish(rates, base, fetched_at, held_until, decimal_rates)
+
+
+def _publish_failure(base: str, error: ConnectionError) -> _RateSnapshot:
+    """
+    Keep serving the last good rates for base after every endpoint failed,
+    or the bundled fallback rates if there are none.
+    
+    Either is cached until an endpoint may be retried, so an outage costs
+    one failed fetch per backoff period instead of one per call.
+    """
+    now = time.time()
+    with _breaker_lock:
+        retry_at = min((_breaker(template).retry_at for template in _config['api_endpoints']), default=now)
+    expires_at = max(retry_at, now + _config['breaker_backoff'])
+    
+    with _lock:
+        snap = _snapshots.get(base)
+        if snap is not None:
+            return _store(snap._replace(expires_at=expires_at, held_until=expires_at))
+    return _publish_fallback(base, expires_at, error)
+
+
+def _publish_fallback(base: str, held_until: Optional[float] = None,
+                      error: Optional[ConnectionError] = None) -> _RateSnapshot:
+    """
+    Publish the bundled fallback rates for base, in offline mode or after
+    error. Raises error (or ConnectionError) if they don't include base.
+    """
+    global _fallback_warned
+    rates = _fallback_rates(base)
+    if rates is None:
+        raise error or ConnectionError(f"Offline mode has no fallback rates for '{base}'")
+    if error is not None and not _fallback_warned:
+        _fallback_warned = True
+        warnings.warn(
+            f"Could not fetch live exchange rates ({error}); using approximate bundled rates "
+            f"from {_FALLBACK_AS_OF}. Check rate_status() for the rates in use.",
+            RuntimeWarning,
+        )
+    with _lock:
+        return _publish(rates, base, time.time(), held_until, fallback=True)
+
+
+def _build_snapshot(base: str, force: bool) -> _RateSnapshot:
+    """Fetch or derive and publish rates for base. Run through _flights."""
+    # A previous flight may have refreshed base just before this one started
+    snap = _snapshots.get(base)
+    if not force and snap is not None and time.time() < snap.expires_at:
+        return snap
+    
+    pivot = _config['pivot_currency']
+    if pivot and pivot.upper() != base:
+        # Derive this base from the pivot table instead of fetching it
+        pivot = pivot.upper()
+        pivot_snap = _snapshots.get(pivot)
+        if force or pivot_snap is None or time.time() >= pivot_snap.expires_at:
+            pivot_snap = _flights.do(pivot, _fetch_snapshot, pivot, force)
+        rates = _cross_rates(pivot_snap.rates, base)
+        if rates is not None:
+            # Keep exact Decimal cross rates when the pivot has them
+            decimal_rates = pivot_snap.derived.get('decimal_rates')
+            if decimal_rates is not None:
+                decimal_rates = _cross_rates(decimal_rates, base)
+            with _lock:
+                return _publish(rates, base, pivot_snap.fetched_at, pivot_snap.held_until, decimal_rates,
+                                pivot_snap.fallback)
+    
+    return _fetch_snapshot(base, force)
+
+
+def _refresh_snapshot(force: bool = False) -> _RateSnapshot:
+    """
+    Fetch and publish rates for the current base currency.
+    
+    Concurrent callers for the same base wait on a single fetch and share
+    its result (or error).
+    """
+    base = _config['base_currency']
+    return _flights.do(base, _build_snapshot, base, force)
+
+
+def _background_refresh():
+    try:
+        _refresh_snapshot()
+    except Exception:
+        pass  # Keep serving stale rates, the next stale read retries
+    finally:
+        _background_lock.release()
+
+
+def _start_background_refresh():
+    """Refresh rates on a daemon thread unless one is already running."""
+    if not _background_lock.acquire(blocking=False):
+        return
+    try:
+        threading.Thread(target=_background_refresh, name='currencyconsts-refresh', daemon=True).start()
+    except Exception:
+        _background_lock.release()
+        raise
+
+
+def _serve_stale(snap: _RateSnapshot) -> bool:
+    """Whether an expired snapshot may still be served while it is refreshed."""
+    if (_config['stale_while_revalidate']
+        and time.time() < snap.fetched_at + _config['hard_expiry_minutes'] * 60):
+        _start_background_refresh()
+        return True
+    return False
+
+
+def _get_snapshot() -> _RateSnapshot:
+    """
+    Get the rate snapshot for the current base, with caching.
+    
+    A warm cache is read with a single reference load of the published
+    snapshot; _lock is only taken when the snapshot is missing or expired.
+    With stale-while-revalidate enabled, expired rates are served until the
+    hard expiry while a background thread fetches replacements.
+    """
+    snap = _snapshot
+    if snap is not None and (time.time() < snap.expires_at or _serve_stale(snap)):
+        return snap
+    return _refresh_snapshot()
+
+
 def _get_rates() -> dict:
     """Get rates with caching."""
-    with _lock:
-        now = datetime.now()
-        base = _config['base_currency']
-        
-        # Check if cache is valid
-        if (_cache['rates'] 
-            and _cache['base'] == base
-            and _cache['last_fetch'] 
-            and (now - _cache['last_fetch']) < timedelta(minutes=_config['cache_ttl_minutes'])):
-            return _cache['rates']
-        
-        # Fetch fresh rates
-        rates = _fetch_rates(base)
-        _cache['rates'] = rates
-        _cache['last_fetch'] = now
-        _cache['base'] = base
-        
-        return rates
+    return _get_snapshot().rates
 
 
 def refresh_rates():
     """Force refresh of exchange rates."""
-    with _lock:
-        _cache['rates'] = {}
-        _cache['last_fetch'] = None
-    _get_rates()
+    _refresh_snapshot(force=True)
 
 
 # ============================================================================
@@ -145,125 +865,1397 @@ def set_base(currency: str):
         set_base('EUR')
         100 * usd  # Convert €100 to USD
     """
+    global _snapshot
+    base = currency.upper()
     with _lock:
-        _config['base_currency'] = currency.upper()
-        _cache['rates'] = {}  # Invalidate cache
-        _cache['last_fetch'] = None
+        _config['base_currency'] = base
+        # Reuse a cached table for this base, _get_rates refreshes it if expired
+        _snapshot = _snapshots.get(base)
+        if _snapshot is not None:
+            _snapshots.move_to_end(base)
 
 
-def set_margin(percent: float):
+def set_margin(percent: Optional[float], currency: Optional[str] = None, direction: str = 'buy'):
     """
     Set a margin/markup percentage on conversions.
     
     This simulates fees that services like PayPal add (~3-4%).
     
     Args:
-        percent: Margin percentage (e.g., 3.5 for 3.5% markup)
+        percent: Margin percentage (e.g., 3.5 for 3.5% markup), or None to
+            clear a currency's override so it inherits the global margin
+        currency: Only apply to this currency, overriding the global margin
+            (None sets the global margin)
+        direction: 'buy' applies to base -> currency (100 * eur), 'sell' to
+            currency -> base (100 / eur), 'both' to either
     
     Example:
         set_margin(3.5)  # Apply 3.5% markup like PayPal
         100 * eur  # Will give slightly less EUR
+        set_margin(1, 'JPY', direction='both')
+        set_margin(None, 'JPY', direction='both')  # Back to the global margin
     """
-    _config['margin_percent'] = percent
+    global _margin_key
+    if direction not in ('buy', 'sell', 'both'):
+        raise ValueError(f"Unknown margin direction '{direction}'")
+    if percent is None and currency is None:
+        raise ValueError("Only a currency's margin can be cleared, set the global margin to 0 instead")
+    buy = direction in ('buy', 'both')
+    sell = direction in ('sell', 'both')
+    
+    with _lock:
+        if currency is None:
+            if buy:
+                _config['margin_percent'] = percent
+            if sell:
+                _config['sell_margin_percent'] = percent
+        else:
+            code = currency.upper()
+            old_buy, old_sell = _config['currency_margins'].get(code, (None, None))
+            override = (percent if buy else old_buy, percent if sell else old_sell)
+            # Copied rather than mutated so readers never see a half-updated dict
+            margins = dict(_config['currency_margins'])
+            if override == (None, None):
+                margins.pop(code, None)
+            else:
+                margins[code] = override
+            _config['currency_margins'] = margins
+        
+        stale_key = _margin_key
+        _margin_key = (_config['margin_percent'], _config['sell_margin_percent'],
+                       tuple(sorted(_config['currency_margins'].items())))
+        if _margin_key != stale_key:
+            _renew_versions(stale_key)
 
 
 def set_cache_ttl(minutes: int):
     """Set how long rates are cached before refresh."""
-    _config['cache_ttl_minutes'] = minutes
+    global _snapshot
+    with _lock:
+        _config['cache_ttl_minutes'] = minutes
+        for base, snap in _snapshots.items():
+            # Provider, outage and pinned expiries outlast the TTL, as in _publish
+            _snapshots[base] = snap._replace(expires_at=max(snap.fetched_at + minutes * 60, snap.held_until))
+        _snapshot = _snapshots.get(_config['base_currency'])
 
 
-# ============================================================================
-# Currency Class
-# ============================================================================
+def set_cache_size(bases: int):
+    """Set how many base currencies keep a cached rate table."""
+    with _lock:
+        _config['cache_max_bases'] = bases
+        while len(_snapshots) > bases:
+            _snapshots.popitem(last=False)
 
-class Currency:
+
+def set_stale_while_revalidate(enabled: bool, hard_expiry_minutes: Optional[int] = None):
     """
-    Currency object that enables intuitive conversion syntax.
+    Serve expired rates while they are refreshed in the background.
     
-    Supports multiplication with numbers for conversion:
-        100 * eur  -> Converts 100 of base currency to EUR
-        eur * 100  -> Same thing
-    """
+    Args:
+        enabled: Whether to refresh expired rates on a background thread
+        hard_expiry_minutes: Age after which callers block on a refresh anyway
     
-    def __init__(self, code: str):
-        self.code = code.upper()
+    Example:
+        set_stale_while_revalidate(True, hard_expiry_minutes=6 * 60)
+    """
+    _config['stale_while_revalidate'] = enabled
+    if hard_expiry_minutes is not None:
+        _config['hard_expiry_minutes'] = hard_expiry_minutes
+
+
+def set_disk_cache(directory: Optional[str]):
+    """
+    Persist fetched rates under directory so new processes start warm.
     
-    @property
-    def rate(self) -> float:
-        """Get the current exchange rate from base currency."""
-        rates = _get_rates()
-        rate = rates.get(self.code)
-        if rate is None:
-            raise ValueError(f"Currency '{self.code}' not found")
-        return rate
+    Rates on disk are used instead of a network fetch while they are younger
+    than the cache TTL. Pass None to disable.
     
-    @property
-    def rate_with_margin(self) -> float:
-        """Get rate with margin applied (simulates service fees)."""
-        base_rate = self.rate
-        margin = _config['margin_percent']
-        # Margin reduces what you get (like PayPal)
-        return base_rate * (1 - margin / 100)
-        
-    def __repr__(self):
-        try:
-            return f"<{self.code}: 1 {_config['base_currency'].upper()} = {self.rate:.6f} {self.code}>"
-        except:
-            return f"<Currency: {self.code.upper()}>"
+    Example:
+        set_disk_cache(os.path.expanduser('~/.cache/currencyconsts'))
+    """
+    _config['disk_cache_dir'] = directory
+
+
+def save_snapshot(path: str):
+    """
+    Write the current rate table to a file for load_snapshot().
     
-    def __rmul__(self, amount: Union[int, float]) -> float:
-        """Enable: 100 * eur"""
-        return self._convert(amount)
+    Example:
+        save_snapshot('rates-2024-06-30.json')
+    """
+    snap = _get_snapshot()
+    _write_rates_file(path, snap.base, snap.rates, snap.fetched_at)
+
+
+def load_snapshot(path: str):
+    """
+    Pin conversions to rates saved by save_snapshot().
     
-    def __mul__(self, amount: Union[int, float]) -> float:
-        """Enable: eur * 100"""
-        return self._convert(amount)
+    The file's base currency becomes the base, and its rates are used
+    without expiring until refresh_rates() is called, so repeated runs give
+    reproducible results.
     
-    def __truediv__(self, amount: Union[int, float]) -> float:
-        """Enable: eur / 100"""
-        return self._convert(1 / amount)
+    Example:
+        load_snapshot('rates-2024-06-30.json')
+        100 * EUR  # Uses the saved EUR rate
+    """
+    global _snapshot
+    with open(path, 'rb') as f:
+        data = json.load(f)
+    try:
+        base, rates, fetched_at = data['base'].upper(), data['rates'], data['fetched_at']
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError(f"{path} is not a rate snapshot file") from None
     
-    def __rtruediv__(self, amount: Union[int, float]) -> float:
-        """Enable: 100 / eur"""
-        return amount / self.rate
+    with _lock:
+        _config['base_currency'] = base
+        _publish(rates, base, fetched_at, held_until=_PINNED)
+
+
+def set_session(session):
+    """
+    Use a custom HTTP session (or any object with a requests-style get()).
     
-    def __floordiv__(self, amount: Union[int, float]) -> float:
-        """Enable: eur // 100"""
-        return self._convert(1) // amount
+    Example:
+        session = requests.Session()
+        session.proxies = {'https': 'http://proxy:3128'}
+        set_session(session)
     
-    def __rfloordiv__(self, amount: Union[int, float]) -> float:
-        """Enable: 100 // eur"""
-        return amount // self._convert(1)
+    Pass None to go back to the module's own session.
+    """
+    global _session, _session_custom
+    with _session_lock:
+        _session = session
+        _session_custom = session is not None
+
+
+def set_http_options(pool_size: Optional[int] = None, retries: Optional[int] = None,
+                     timeout: Optional[float] = None):
+    """
+    Configure the shared HTTP session used to fetch rates.
     
-    def __add__(self, amount: Union[int, float]) -> float:
-        """Enable: eur + 100"""
-        return self._convert(1) + amount
+    A session installed with set_session() is left untouched; pool_size and
+    retries apply once the module creates its own session again.
     
-    def __radd__(self, amount: Union[int, float]) -> float:
-        """Enable: 100 + eur"""
-        return amount + self._convert(1)
+    Args:
+        pool_size: Keep-alive connections kept per host
+        retries: Transport-level retries per request
+        timeout: Seconds to wait for each request
+    """
+    global _session
+    if timeout is not None:
+        _config['http_timeout'] = timeout
+    if pool_size is None and retries is None:
+        return
+    if pool_size is not None:
+        _config['http_pool_size'] = pool_size
+    if retries is not None:
+        _config['http_retries'] = retries
+    with _session_lock:
+        if _session_custom:
+            return
+        old, _session = _session, None
+    if old is not None:
+        old.close()
+
+
+def set_fetch_mode(mode: str, hedge_delay: Optional[float] = None, adaptive: Optional[bool] = None):
+    """
+    Choose how multiple api_endpoints are queried.
     
-    def __sub__(self, amount: Union[int, float]) -> float:
-        """Enable: eur - 100"""
-        return self._convert(1) - amount
+    Args:
+        mode: 'sequential' tries endpoints in order, 'race' queries all of
+            them at once and 'hedged' starts the next endpoint only when the
+            running ones are slower than hedge_delay
+        hedge_delay: Seconds to wait before hedging
+        adaptive: Order endpoints by observed latency and error rate (see
+            endpoint_stats) instead of as configured
+    
+    Example:
+        set_fetch_mode('hedged', hedge_delay=0.3)
+    """
+    if mode not in ('sequential', 'race', 'hedged'):
+        raise ValueError(f"Unknown fetch mode '{mode}'")
+    _config['fetch_mode'] = mode
+    if hedge_delay is not None:
+        _config['hedge_delay'] = hedge_delay
+    if adaptive is not None:
+        _config['adaptive_endpoints'] = adaptive
+
+
+def set_circuit_breaker(threshold: Optional[int] = None, backoff: Optional[float] = None,
+                        max_backoff: Optional[float] = None):
+    """
+    Configure how failing endpoints are skipped.
+    
+    While every endpoint is skipped, the last good rates (or the bundled
+    fallback rates) are served without attempting a fetch.
+    
+    Args:
+        threshold: Consecutive failures before an endpoint is skipped
+        backoff: Seconds an endpoint is first skipped for, doubling each
+            time its retry fails
+        max_backoff: Longest an endpoint is skipped for
+    
+    Example:
+        set_circuit_breaker(threshold=1, backoff=30)
+    """
+    if threshold is not None:
+        _config['breaker_threshold'] = threshold
+    if backoff is not None:
+        _config['breaker_backoff'] = backoff
+    if max_backoff is not None:
+        _config['breaker_max_backoff'] = max_backoff
+
+
+def fetch_stats() -> dict:
+    """
+    Get counters for rate fetches.
+    
+    Returns:
+        dict with 'calls' (refresh requests), 'executions' (fetches actually
+        run) and 'coalesced' (callers that waited on another's fetch)
+    """
+    with _flights._lock:
+        return dict(_flights.stats)
+
+
+def endpoint_stats() -> dict:
+    """
+    Get request statistics for each API endpoint, in the order they are tried.
+    
+    Returns:
+        dict of endpoint template -> dict with 'state' ('closed', 'open' or
+        'half_open'), 'requests', 'errors', 'latency' (moving average of
+        successful request seconds, None if untried) and 'error_rate'
+        (moving average of the failed fraction)
+    """
+    with _breaker_lock:
+        endpoints = [(template, _breaker(template)) for template in _config['api_endpoints']]
+        if _config['adaptive_endpoints']:
+            endpoints.sort(key=lambda item: item[1].cost())
+        return {
+            template: {
+                'state': breaker.state,
+                'requests': breaker.requests,
+                'errors': breaker.errors,
+                'latency': breaker.latency,
+                'error_rate': breaker.error_rate,
+            }
+            for template, breaker in endpoints
+        }
+
+
+def set_json_decoder(loads=None):
+    """
+    Choose the function decoding API responses.
+    
+    Args:
+        loads: Called with the response bytes, like json.loads. None picks
+            orjson or ujson when installed, else json. Decimal mode always
+            uses json, which can parse floats as Decimal.
+    
+    Example:
+        import simdjson
+        set_json_decoder(simdjson.loads)
+    """
+    global _json_loads
+    _json_loads = loads
+
+
+def rate_status() -> dict:
+    """
+    Describe the rates conversions currently use, fetching them if needed.
+    
+    Returns:
+        dict with 'base', 'fetched_at' and 'expires_at' (Unix times),
+        'using_fallback' (True when live rates couldn't be fetched, or in
+        offline mode, and the bundled approximate rates are in use) and
+        'fallback_as_of' (the date of those rates)
+    
+    Example:
+        if rate_status()['using_fallback']:
+            print("Rates are approximate")
+    """
+    snap = _get_snapshot()
+    return {
+        'base': snap.base,
+        'fetched_at': snap.fetched_at,
+        'expires_at': snap.expires_at,
+        'using_fallback': snap.fallback,
+        'fallback_as_of': _FALLBACK_AS_OF,
+    }
+
+
+def set_decimal_mode(enabled: bool):
+    """
+    Parse fetched rates as Decimal so Decimal conversions are exact.
+    
+    Decimal amounts always convert to Decimal results (Decimal('100') * EUR);
+    this makes their rates the API's exact digits instead of ones recovered
+    from floats. Takes effect on the next fetch.
+    """
+    _config['decimal_rates'] = enabled
+
+
+def set_offline_mode(enabled: bool):
+    """
+    Use the bundled fallback rates without any network access.
+    
+    The fallback table is also used automatically, with a warning, when
+    every API endpoint fails and no earlier rates are cached. Its rates are
+    approximate and dated; rate_status() tells when they are in use.
+    """
+    global _snapshot
+    with _lock:
+        _config['offline_mode'] = enabled
+        # Drop tables from the other mode so the next read reloads
+        _snapshots.clear()
+        _snapshot = None
+
+
+# ============================================================================
+# Cross Rates
+# ============================================================================
+
+def cross_rate(from_currency: str, to_currency: str) -> float:
+    """
+    Get the rate between any two currencies from the cached table.
+    
+    Example:
+        cross_rate('EUR', 'JPY')  # 1 EUR in JPY, whatever the base
+    """
+    rates = _get_rates()
+    try:
+        return rates[to_currency.upper()] / rates[from_currency.upper()]
+    except KeyError as e:
+        raise ValueError(f"Currency '{e.args[0]}' not found") from None
+
+
+def cross_rate_matrix(codes: Optional[list] = None) -> dict:
+    """
+    Get every pairwise rate between codes as {from: {to: rate}}.
+    
+    The matrix is computed once per rate table and reused until the rates
+    are refreshed.
+    
+    Args:
+        codes: Currency codes to include (defaults to CURRENCY_CODES)
+    """
+    snap = _get_snapshot()
+    codes = tuple(c.upper() for c in (CURRENCY_CODES if codes is None else codes))
+    key = ('cross_rate_matrix', codes)
+    matrix = snap.derived.get(key)
+    if matrix is None:
+        rates = snap.rates
+        present = [c for c in codes if c in rates]
+        matrix = {a: {b: rates[b] / rates[a] for b in present} for a in present}
+        snap.derived[key] = matrix
+    return matrix
+
+
+# ============================================================================
+# Currency Class
+# ============================================================================
+
+class Currency:
+    """
+    Currency object that enables intuitive conversion syntax.
+    
+    Supports multiplication with numbers for conversion:
+        100 * eur  -> Converts 100 of base currency to EUR
+        eur * 100  -> Same thing
+    
+    Instances are interned per code, so Currency('eur') is EUR.
+    """
+    
+    __slots__ = ('code', '_slot', '_decimal_slot')
+    
+    _instances = {}
+    
+    def __new__(cls, code: str):
+        code = code.upper()
+        currency = cls._instances.get(code)
+        if currency is None:
+            currency = super().__new__(cls)
+            currency.code = code
+            # (snapshot version, rate, rate with margin, sell divisor), see _rate_slot
+            currency._slot = (0, None, None, None)
+            currency._decimal_slot = (0, None, None, None)
+            currency = cls._instances.setdefault(code, currency)
+        return currency
+    
+    def __reduce__(self):
+        return (Currency, (self.code,))
+    
+    @property
+    def minor_units(self) -> int:
+        """Digits after the decimal point in this currency (ISO 4217), e.g. 2 for EUR, 0 for JPY."""
+        return _MINOR_UNITS.get(self.code, 2)
+    
+    @property
+    def rate(self) -> float:
+        """Get the current exchange rate from base currency."""
+        return self._rate_slot()[1]
+    
+    @property
+    def rate_with_margin(self) -> float:
+        """Get rate with margin applied (simulates service fees)."""
+        return self._rate_slot()[2]
+    
+    def __repr__(self):
+        try:
+            return f"<{self.code}: 1 {_config['base_currency'].upper()} = {self.rate:.6f} {self.code}>"
+        except:
+            return f"<Currency: {self.code.upper()}>"
+    
+    def __rmul__(self, amount: Union[int, float]) -> float:
+        """Enable: 100 * eur"""
+        if isinstance(amount, Decimal):
+            # Decimal amounts can't mix with float rates, use the Decimal table
+            converted = amount * self._decimal_rates()[2]
+        else:
+            converted = amount * self._rate_slot()[2]
+        if _config['money_results']:
+            return Money.of(converted, self)
+        return converted
+    
+    def __mul__(self, amount: Union[int, float]) -> float:
+        """Enable: eur * 100"""
+        if isinstance(amount, Money):
+            return amount.to(self)
+        return self.__rmul__(amount)
+    
+    def __truediv__(self, amount: Union[int, float]) -> float:
+        """Enable: eur / 100"""
+        return self._convert(1 / amount)
+    
+    def __rtruediv__(self, amount: Union[int, float]) -> float:
+        """Enable: 100 / eur"""
+        if isinstance(amount, Decimal):
+            converted = amount / self._decimal_rates()[3]
+        else:
+            converted = amount / self._rate_slot()[3]
+        if _config['money_results']:
+            return Money.of(converted, _config['base_currency'])
+        return converted
+    
+    def __floordiv__(self, amount: Union[int, float]) -> float:
+        """Enable: eur // 100"""
+        return self._unit(amount) // amount
+    
+    def __rfloordiv__(self, amount: Union[int, float]) -> float:
+        """Enable: 100 // eur"""
+        return amount // self._unit(amount)
+    
+    def __add__(self, amount: Union[int, float]) -> float:
+        """Enable: eur + 100"""
+        return self._unit(amount) + amount
+    
+    def __radd__(self, amount: Union[int, float]) -> float:
+        """Enable: 100 + eur"""
+        return amount + self._unit(amount)
+    
+    def __sub__(self, amount: Union[int, float]) -> float:
+        """Enable: eur - 100"""
+        return self._unit(amount) - amount
     
     def __rsub__(self, amount: Union[int, float]) -> float:
         """Enable: 100 - eur"""
-        return amount - self._convert(1)
+        return amount - self._unit(amount)
     
     def __mod__(self, amount: Union[int, float]) -> float:
         """Enable: eur % 100"""
-        return self._convert(1) % amount
+        return self._unit(amount) % amount
     
     def __rmod__(self, amount: Union[int, float]) -> float:
         """Enable: 100 % eur"""
-        return amount % self._convert(1)
+        return amount % self._unit(amount)
+    
+    def _rate_in(self, rates: dict) -> float:
+        rate = rates.get(self.code)
+        if rate is None:
+            raise ValueError(f"Currency '{self.code}' not found")
+        return rate
+    
+    def _rate_slot(self) -> tuple:
+        """
+        Get (snapshot version, rate, rate with margin, sell divisor) for the
+        current rates.
+        
+        Cached per instance; snapshot versions change whenever the rates or
+        the margins do, so a warm slot only costs a version and expiry check.
+        """
+        snap = _snapshot
+        slot = self._slot
+        if snap is not None and slot[0] == snap.version and time.time() < snap.expires_at:
+            return slot
+        
+        snap = _get_snapshot()
+        buy, sell = _margin_tables(snap)
+        slot = self._slot = (snap.version, self._rate_in(snap.rates), buy[self.code], sell[self.code])
+        return slot
+    
+    def _decimal_rates(self) -> tuple:
+        """Like _rate_slot, with Decimal rates."""
+        snap = _snapshot
+        slot = self._decimal_slot
+        if snap is not None and slot[0] == snap.version and time.time() < snap.expires_at:
+            return slot
+        
+        snap = _get_snapshot()
+        rates, buy, sell = _decimal_tables(snap)
+        slot = self._decimal_slot = (snap.version, self._rate_in(rates), buy[self.code], sell[self.code])
+        return slot
     
     def _convert(self, amount: Union[int, float]) -> float:
         """Perform the conversion."""
-        rate = self.rate_with_margin if _config['margin_percent'] > 0 else self.rate
-        converted = amount * rate
-        return converted
+        if isinstance(amount, Decimal):
+            return amount * self._decimal_rates()[2]
+        return amount * self._rate_slot()[2]
+    
+    def _unit(self, amount: Union[int, float, Decimal]) -> Union[float, Decimal]:
+        """One base unit converted, as a Decimal when amount is one."""
+        return self._convert(Decimal(1) if isinstance(amount, Decimal) else 1)
+    
+    def _convert_in(self, snap: _RateSnapshot, amount: Union[int, float]) -> float:
+        """Perform the conversion against a given snapshot."""
+        buy = _decimal_tables(snap)[1] if isinstance(amount, Decimal) else _margin_tables(snap)[0]
+        return amount * self._rate_in(buy)
+
+
+# ============================================================================
+# Money
+# ============================================================================
+
+def _round_half_even(value) -> int:
+    """Round to the nearest integer, ties to even (banker's rounding)."""
+    if isinstance(value, Decimal):
+        return int(value.to_integral_value(ROUND_HALF_EVEN))
+    return round(value)
+
+
+def _exact(number):
+    """A float as the Decimal of its shortest repr (1.015 -> Decimal('1.015')), others unchanged."""
+    return Decimal(repr(number)) if isinstance(number, float) else number
+
+
+class Money:
+    """
+    Exact amount of a currency, held as an integer number of minor units.
+    
+    Arithmetic between amounts of the same currency is exact integer math;
+    rounding (half to even, at the currency's ISO 4217 exponent) only
+    happens when a number is turned into Money or a conversion is made.
+    
+    Example:
+        price = Money.of(19.99, 'EUR')  # Money(1999, EUR)
+        price * 3                       # Money(5997, EUR)
+        price * JPY                     # Converted to JPY, rounded to whole yen
+    """
+    
+    __slots__ = ('minor', 'currency')
+    
+    def __init__(self, minor: int, currency: Union[str, Currency]):
+        self.minor = minor
+        self.currency = currency if isinstance(currency, Currency) else Currency(currency)
+    
+    @classmethod
+    def of(cls, amount: Union[int, float, Decimal], currency: Union[str, Currency]) -> 'Money':
+        """Create Money from an amount in major units (e.g. 12.34 EUR)."""
+        currency = currency if isinstance(currency, Currency) else Currency(currency)
+        exponent = currency.minor_units
+        if isinstance(amount, int):
+            return cls(amount * 10 ** exponent, currency)
+        # Scaling the binary float would turn ties like 1.015 into 101.49999...
+        return cls(_round_half_even(_exact(amount).scaleb(exponent)), currency)
+    
+    @property
+    def amount(self) -> Decimal:
+        """Exact amount in major units."""
+        return Decimal(self.minor).scaleb(-self.currency.minor_units)
+    
+    def to(self, currency: Union[str, Currency]) -> 'Money':
+        """Convert to another currency at the current rate, margin applied."""
+        currency = currency if isinstance(currency, Currency) else Currency(currency)
+        if currency is self.currency:
+            return self
+        snap = _get_snapshot()
+        factor = _pair_factor(_pair_tables(snap), self.currency.code, currency.code)
+        return Money.of(self.minor * factor / 10 ** self.currency.minor_units, currency)
+    
+    def _check(self, other: 'Money'):
+        if other.currency is not self.currency:
+            raise ValueError(f"Cannot combine {self.currency.code} and {other.currency.code} amounts")
+    
+    def __repr__(self):
+        return f"Money({self.minor}, {self.currency.code})"
+    
+    def __str__(self):
+        return f"{self.amount} {self.currency.code}"
+    
+    def __float__(self):
+        return self.minor / 10 ** self.currency.minor_units
+    
+    def __bool__(self):
+        return self.minor != 0
+    
+    def __hash__(self):
+        return hash((self.minor, self.currency.code))
+    
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.minor == other.minor and self.currency is other.currency
+        return NotImplemented
+    
+    def __lt__(self, other: 'Money') -> bool:
+        if not isinstance(other, Money):
+            return NotImplemented
+        self._check(other)
+        return self.minor < other.minor
+    
+    def __le__(self, other: 'Money') -> bool:
+        if not isinstance(other, Money):
+            return NotImplemented
+        self._check(other)
+        return self.minor <= other.minor
+    
+    def __gt__(self, other: 'Money') -> bool:
+        if not isinstance(other, Money):
+            return NotImplemented
+        self._check(other)
+        return self.minor > other.minor
+    
+    def __ge__(self, other: 'Money') -> bool:
+        if not isinstance(other, Money):
+            return NotImplemented
+        self._check(other)
+        return self.minor >= other.minor
+    
+    def __neg__(self) -> 'Money':
+        return Money(-self.minor, self.currency)
+    
+    def __abs__(self) -> 'Money':
+        return Money(abs(self.minor), self.currency)
+    
+    def __add__(self, other: 'Money') -> 'Money':
+        if isinstance(other, Money):
+            self._check(other)
+            return Money(self.minor + other.minor, self.currency)
+        if other == 0:
+            return self
+        return NotImplemented
+    
+    def __radd__(self, other) -> 'Money':
+        """Enable: sum(amounts)"""
+        return self.__add__(other)
+    
+    def __sub__(self, other: 'Money') -> 'Money':
+        if isinstance(other, Money):
+            self._check(other)
+            return Money(self.minor - other.minor, self.currency)
+        return NotImplemented
+    
+    def __mul__(self, other):
+        """Scale by a number, or convert with: money * eur"""
+        if isinstance(other, Currency):
+            return self.to(other)
+        if isinstance(other, int):
+            return Money(self.minor * other, self.currency)
+        if isinstance(other, (float, Decimal)):
+            return Money(_round_half_even(self.minor * _exact(other)), self.currency)
+        return NotImplemented
+    
+    def __rmul__(self, other):
+        if isinstance(other, (int, float, Decimal)):
+            return self.__mul__(other)
+        return NotImplemented
+    
+    def __truediv__(self, other):
+        """Divide by a number, or by Money of the same currency for a ratio."""
+        if isinstance(other, Money):
+            self._check(other)
+            return self.minor / other.minor
+        if isinstance(other, (int, float, Decimal)):
+            return Money(_round_half_even(self.minor / _exact(other)), self.currency)
+        return NotImplemented
+
+
+def sum_money(amounts) -> Money:
+    """
+    Sum Money of a single currency, adding the integer minor units directly.
+    
+    Raises:
+        ValueError: If amounts is empty or mixes currencies
+    """
+    amounts = iter(amounts)
+    first = next(amounts, None)
+    if first is None:
+        raise ValueError("sum_money() needs at least one amount")
+    currency = first.currency
+    total = first.minor
+    for money in amounts:
+        if money.currency is not currency:
+            first._check(money)
+        total += money.minor
+    return Money(total, currency)
+
+
+def total_by_currency(amounts) -> dict:
+    """
+    Sum Money of mixed currencies.
+    
+    Returns:
+        dict of currency code -> Money total
+    """
+    totals = {}
+    currencies = {}
+    for money in amounts:
+        code = money.currency.code
+        totals[code] = totals.get(code, 0) + money.minor
+        currencies[code] = money.currency
+    return {code: Money(minor, currencies[code]) for code, minor in totals.items()}
+
+
+def money_from_amounts(amounts, currency: Union[str, Currency]) -> Money:
+    """
+    Total many major-unit amounts (e.g. floats from a ledger) as Money.
+    
+    Each amount is rounded to minor units once, then summed as integers,
+    without creating a Money object per amount.
+    """
+    currency = currency if isinstance(currency, Currency) else Currency(currency)
+    exponent = currency.minor_units
+    return Money(sum(
+        amount * 10 ** exponent if isinstance(amount, int) else _round_half_even(_exact(amount).scaleb(exponent))
+        for amount in amounts
+    ), currency)
+
+
+def set_money_mode(enabled: bool):
+    """
+    Return Money instead of float from conversions like 100 * EUR.
+    
+    Example:
+        set_money_mode(True)
+        100 * EUR  # Money(9000, EUR)
+    """
+    _config['money_results'] = enabled
+
+
+# ============================================================================
+# Async API
+# ============================================================================
+
+# (loop, base, force) -> future of the refresh running in that loop's executor
+_async_refreshes = {}
+
+
+async def _arefresh_snapshot(force: bool = False) -> _RateSnapshot:
+    """Refresh rates without blocking the event loop, sharing one fetch per base."""
+    import asyncio
+    
+    loop = asyncio.get_running_loop()
+    key = (loop, _config['base_currency'], force)
+    future = _async_refreshes.get(key)
+    if future is None:
+        future = loop.run_in_executor(None, _refresh_snapshot, force)
+        _async_refreshes[key] = future
+        future.add_done_callback(lambda _: _async_refreshes.pop(key, None))
+    # Shield so one cancelled waiter doesn't cancel the fetch for the others
+    return await asyncio.shield(future)
+
+
+async def _aget_snapshot() -> _RateSnapshot:
+    snap = _snapshot
+    if snap is not None and (time.time() < snap.expires_at or _serve_stale(snap)):
+        return snap
+    return await _arefresh_snapshot()
+
+
+async def aget_rates() -> dict:
+    """
+    Get rates without blocking the event loop.
+    
+    Shares the same cache as the synchronous API; a cold or expired cache is
+    fetched on the loop's default executor.
+    """
+    return (await _aget_snapshot()).rates
+
+
+async def aconvert(amount: Union[int, float], currency: str) -> float:
+    """
+    Convert amount of the base currency to currency without blocking.
+    
+    Example:
+        await aconvert(100, 'EUR')  # Same as 100 * EUR
+    """
+    target = Currency(currency)
+    converted = target._convert_in(await _aget_snapshot(), amount)
+    if _config['money_results']:
+        return Money.of(converted, target)
+    return converted
+
+
+async def arefresh_rates():
+    """Force refresh of exchange rates without blocking the event loop."""
+    await _arefresh_snapshot(force=True)
+
+
+# ============================================================================
+# Batch Conversion
+# ============================================================================
+
+def _rate_vector(snap: _RateSnapshot) -> tuple:
+    """
+    Get (code -> index, rates array) for a snapshot, built once per snapshot.
+    
+    Codes are ordered as CURRENCY_CODES followed by any other codes in the
+    table, so indices into CURRENCY_CODES are valid indices into the array.
+    """
+    vector = snap.derived.get('rate_vector')
+    if vector is None:
+        import numpy as np
+        
+        codes = list(CURRENCY_CODES) + sorted(set(snap.rates).difference(CURRENCY_CODES))
+        index = {code: i for i, code in enumerate(codes)}
+        rates = np.array([snap.rates.get(code, np.nan) for code in codes], dtype=float)
+        vector = snap.derived['rate_vector'] = (index, rates)
+    return vector
+
+
+def _pair_vectors(snap: _RateSnapshot, index: dict) -> tuple:
+    """(buy, sell) arrays of _pair_tables aligned with _rate_vector."""
+    key = ('pair_vectors', _margin_key)
+    vectors = snap.derived.get(key)
+    if vectors is None:
+        import numpy as np
+        
+        _, buy, sell = _pair_tables(snap)
+        vectors = snap.derived[key] = tuple(
+            np.array([table.get(code, np.nan) for code in index], dtype=float) for table in (buy, sell)
+        )
+    return vectors
+
+
+def _code_indices(np, codes, index: dict):
+    """Map a code, array of codes or array of integer indices to rate indices."""
+    codes = np.asarray(codes)
+    if codes.dtype.kind in 'iu':
+        # Negative indices would silently wrap around to other currencies
+        invalid = (codes < 0) | (codes >= len(index))
+        if invalid.any():
+            raise ValueError(f"Currency index {codes[invalid].flat[0]} out of range 0-{len(index) - 1}")
+        return codes
+    # Look up each distinct code once, then broadcast back through the inverse
+    unique, inverse = np.unique(codes, return_inverse=True)
+    try:
+        lookup = np.array([index[str(code).upper()] for code in unique], dtype=np.intp)
+    except KeyError as e:
+        raise ValueError(f"Currency '{e.args[0]}' not found") from None
+    return lookup[inverse].reshape(codes.shape)
+
+
+def convert_array(amounts, from_codes=None, to_codes=None):
+    """
+    Convert arrays of amounts between currencies in one vectorized step.
+    
+    Requires NumPy (pip install currencyconsts[numpy]).
+    
+    Args:
+        amounts: Array-like of amounts
+        from_codes: Currency code, array of codes or array of integer indices
+            into CURRENCY_CODES the amounts are in (defaults to the base)
+        to_codes: Same, for the currencies to convert to (defaults to the base)
+    
+    Returns:
+        numpy.ndarray of converted amounts, with the margin applied
+    
+    Example:
+        convert_array([100, 250], ['EUR', 'GBP'], 'JPY')
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("convert_array requires NumPy: pip install currencyconsts[numpy]") from None
+    
+    snap = _get_snapshot()
+    index = _rate_vector(snap)[0]
+    buy, sell = _pair_vectors(snap, index)
+    to_indices = _code_indices(np, snap.base if to_codes is None else to_codes, index)
+    from_indices = _code_indices(np, snap.base if from_codes is None else from_codes, index)
+    factors = buy[to_indices] / sell[from_indices]
+    if np.isnan(factors).any():
+        raise ValueError("Rates are unavailable for some of the requested currencies")
+    # Amounts already in the target currency are left as they are
+    factors = np.where(to_indices == from_indices, 1.0, factors)
+    return np.asarray(amounts, dtype=float) * factors
+
+
+def _pair_factor(tables: tuple, from_code: Optional[str], to_code: Optional[str]) -> float:
+    """
+    Margin-adjusted rate from one currency to another, with _pair_tables.
+    
+    None stands for the base currency. Converting a currency to itself
+    applies no margin.
+    """
+    base, buy, sell = tables
+    from_code = base if from_code is None else from_code.upper()
+    to_code = base if to_code is None else to_code.upper()
+    try:
+        to_rate, from_rate = buy[to_code], sell[from_code]
+    except KeyError as e:
+        raise ValueError(f"Currency '{e.args[0]}' not found") from None
+    return 1.0 if from_code == to_code else to_rate / from_rate
+
+
+def convert_many(amounts, currency: str) -> array:
+    """
+    Convert many amounts of the base currency to currency.
+    
+    Same result as [amount * Currency(currency) for amount in amounts], but
+    the rate is looked up once. Works on any iterable of numbers, including
+    array.array and memoryview.
+    
+    Returns:
+        array.array('d') of converted amounts
+    
+    Example:
+        convert_many(array('d', [100, 250]), 'EUR')
+    """
+    factor = Currency(currency)._rate_slot()[2]
+    return array('d', [amount * factor for amount in amounts])
+
+
+def convert_many_pairs(amounts, from_codes, to_codes) -> array:
+    """
+    Convert many amounts, each between its own pair of currencies.
+    
+    All amounts use one rate snapshot, and each distinct pair's rate is
+    computed once.
+    
+    Args:
+        amounts: Iterable of amounts
+        from_codes: Currency code, or iterable of codes, the amounts are in
+            (None for the base currency)
+        to_codes: Currency code, or iterable of codes, to convert to
+    
+    Returns:
+        array.array('d') of converted amounts
+    
+    Example:
+        convert_many_pairs([100, 250], ['EUR', 'GBP'], 'JPY')
+    """
+    return _convert_pairs(_pair_tables(_get_snapshot()), amounts, from_codes, to_codes)
+
+
+def _convert_pairs(tables: tuple, amounts, from_codes, to_codes) -> array:
+    """Convert amounts pairwise with _pair_tables, where None codes mean the base."""
+    if from_codes is None or isinstance(from_codes, str):
+        from_codes = itertools.repeat(from_codes)
+    if to_codes is None or isinstance(to_codes, str):
+        to_codes = itertools.repeat(to_codes)
+    
+    factors = {}
+    result = array('d')
+    append = result.append
+    for amount, from_code, to_code in zip(amounts, from_codes, to_codes):
+        factor = factors.get((from_code, to_code))
+        if factor is None:
+            factor = factors[from_code, to_code] = _pair_factor(tables, from_code, to_code)
+        append(amount * factor)
+    return result
+
+
+# ============================================================================
+# Streaming Conversion
+# ============================================================================
+
+def _chunks(rows, chunk_size: int):
+    """Yield (first row number, list of rows) for chunks of up to chunk_size rows."""
+    rows = iter(rows)
+    first_row = 1
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield first_row, chunk
+        first_row += len(chunk)
+
+
+def _convert_chunk_rows(chunk: list, first_row: int, tables: tuple, amount_field: str,
+                        currency_field: Optional[str], source: Optional[str], target: str,
+                        output_field: Optional[str]) -> list:
+    """Convert a chunk of rows in place, numbering rows from first_row in errors."""
+    amounts = array('d')
+    from_codes = [] if currency_field else source
+    for number, row in enumerate(chunk, first_row):
+        try:
+            amount = row[amount_field]
+        except (KeyError, TypeError):
+            raise ValueError(f"Row {number}: no '{amount_field}' field") from None
+        try:
+            amounts.append(float(amount))
+        except (TypeError, ValueError):
+            raise ValueError(f"Row {number}: invalid amount {amount!r} in '{amount_field}'") from None
+        if currency_field:
+            try:
+                from_codes.append(row[currency_field])
+            except (KeyError, TypeError):
+                raise ValueError(f"Row {number}: no '{currency_field}' field") from None
+    converted = _convert_pairs(tables, amounts, from_codes, target)
+    
+    if output_field is None:
+        for row, amount in zip(chunk, converted):
+            row[amount_field] = amount
+            if currency_field:
+                row[currency_field] = target
+    else:
+        for row, amount in zip(chunk, converted):
+            row[output_field] = amount
+    return chunk
+
+
+def _convert_rows(rows, convert_args: tuple, chunk_size: int):
+    """Lazily convert rows with _convert_chunk_rows(chunk, first_row, *convert_args)."""
+    for first_row, chunk in _chunks(rows, chunk_size):
+        yield from _convert_chunk_rows(chunk, first_row, *convert_args)
+
+
+def _csv_io(infile, outfile, fields: tuple, output_field: Optional[str]) -> tuple:
+    """
+    Get (rows, write) for converting a CSV file.
+    
+    The header is written only once every field in fields (None entries
+    are skipped) is known to be a column of infile.
+    """
+    reader = csv.DictReader(infile)
+    fieldnames = list(reader.fieldnames or [])
+    for field in fields:
+        if field is not None and field not in fieldnames:
+            raise ValueError(f"Column '{field}' not found, the columns are: {', '.join(fieldnames) or 'none'}")
+    if output_field is not None and output_field not in fieldnames:
+        fieldnames.append(output_field)
+    writer = csv.DictWriter(outfile, fieldnames)
+    writer.writeheader()
+    return reader, writer.writerow
+
+
+def _jsonl_io(infile, outfile) -> tuple:
+    """Get (rows, write) for converting a JSON Lines file."""
+    def rows():
+        for number, line in enumerate(infile, 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"Line {number}: {e.msg}") from None
+    
+    return rows(), lambda row: outfile.write(json.dumps(row) + '\n')
+
+
+def _write_rows(rows, write) -> int:
+    count = 0
+    for row in rows:
+        write(row)
+        count += 1
+    return count
+
+
+def convert_stream(rows, amount_field: str, currency_field: Optional[str], target: str,
+                   output_field: Optional[str] = None, chunk_size: int = 10000,
+                   source: Optional[str] = None):
+    """
+    Lazily convert an iterable of dict rows, one chunk at a time.
+    
+    The rate snapshot is pinned when this is called, so every row of the
+    stream is converted with the same rates no matter how long it takes to
+    consume, and memory use is bounded by chunk_size.
+    
+    Args:
+        rows: Iterable of dicts, e.g. a csv.DictReader
+        amount_field: Key holding the amount (numbers or numeric strings)
+        currency_field: Key holding each row's currency code, or None if
+            all amounts are in source
+        target: Currency code to convert to
+        output_field: Key to store the result under. By default the amount
+            is replaced and the row's currency set to target.
+        chunk_size: Rows converted per batch
+        source: Currency code of every amount when currency_field is None
+            (defaults to the base currency)
+    
+    Yields:
+        The converted rows
+    
+    Example:
+        rows = convert_stream(csv.DictReader(f), 'amount', 'currency', 'EUR')
+    """
+    snap = _get_snapshot()
+    convert_args = (_pair_tables(snap), amount_field, currency_field, source, target.upper(), output_field)
+    return _convert_rows(rows, convert_args, chunk_size)
+
+
+def convert_csv(infile, outfile, amount_field: str, currency_field: Optional[str], target: str,
+                output_field: Optional[str] = None, chunk_size: int = 10000,
+                source: Optional[str] = None) -> int:
+    """
+    Stream a CSV file through convert_stream, writing rows as they convert.
+    
+    Args:
+        infile: Readable text file with a header row
+        outfile: Writable text file
+        (others as for convert_stream)
+    
+    Returns:
+        Number of rows written
+    """
+    rows, write = _csv_io(infile, outfile, (amount_field, currency_field), output_field)
+    return _write_rows(convert_stream(rows, amount_field, currency_field, target, output_field, chunk_size, source),
+                       write)
+
+
+def convert_jsonl(infile, outfile, amount_field: str, currency_field: Optional[str], target: str,
+                  output_field: Optional[str] = None, chunk_size: int = 10000,
+                  source: Optional[str] = None) -> int:
+    """
+    Stream a JSON Lines file through convert_stream, writing rows as they convert.
+    
+    Args:
+        infile: Readable text file with one JSON object per line
+        outfile: Writable text file
+        (others as for convert_stream)
+    
+    Returns:
+        Number of rows written
+    """
+    rows, write = _jsonl_io(infile, outfile)
+    return _write_rows(convert_stream(rows, amount_field, currency_field, target, output_field, chunk_size, source),
+                       write)
+
+
+# ============================================================================
+# pandas Integration
+# ============================================================================
+
+def _series_codes(pd, codes, index):
+    """Upper case codes aligned with index, broadcasting a single code."""
+    if not isinstance(codes, pd.Series):
+        codes = pd.Series(codes, index=index, dtype=object)
+    return codes.str.upper()
+
+
+def _series_rates(pd, snap: _RateSnapshot, codes, side: int):
+    """Look codes (an upper case Series) up in the buy (side 1) or sell (side 2) table of _pair_tables."""
+    key = ('pair_series', side, _margin_key)
+    rates = snap.derived.get(key)
+    if rates is None:
+        rates = snap.derived[key] = pd.Series(_pair_tables(snap)[side], dtype=float)
+    looked_up = codes.map(rates)
+    missing = looked_up.isna()
+    if missing.any():
+        raise ValueError(f"Currencies not found: {sorted(str(code) for code in codes[missing].unique())}")
+    return looked_up
+
+
+def _convert_series(amounts, from_codes, to_codes):
+    import pandas as pd
+    
+    snap = _get_snapshot()
+    tables = _pair_tables(snap)
+    if (from_codes is None or isinstance(from_codes, str)) and (to_codes is None or isinstance(to_codes, str)):
+        return amounts * _pair_factor(tables, from_codes, to_codes)
+    
+    from_codes = _series_codes(pd, snap.base if from_codes is None else from_codes, amounts.index)
+    to_codes = _series_codes(pd, snap.base if to_codes is None else to_codes, amounts.index)
+    factors = _series_rates(pd, snap, to_codes, 1) / _series_rates(pd, snap, from_codes, 2)
+    # Amounts already in the target currency are left as they are
+    return amounts * factors.mask(from_codes == to_codes, 1.0)
+
+
+class _SeriesCurrencyAccessor:
+    """Conversions on a Series of amounts, available as series.currency."""
+    
+    def __init__(self, series):
+        self._series = series
+    
+    def convert(self, to=None, from_=None):
+        """
+        Convert the amounts between currencies.
+        
+        Args:
+            to: Code to convert to, or codes aligned with the series
+                (defaults to the base currency)
+            from_: Code the amounts are in, or codes aligned with the series
+                (defaults to the base currency)
+        
+        Example:
+            df['amt'].currency.convert(to='EUR', from_=df['ccy'])
+        """
+        return _convert_series(self._series, from_, to)
+
+
+class _FrameCurrencyAccessor:
+    """Conversions on a column of amounts, available as frame.currency."""
+    
+    def __init__(self, frame):
+        self._frame = frame
+    
+    def convert(self, column: str, to: Optional[str] = None, from_col: Optional[str] = None,
+                from_: Optional[str] = None, to_col: Optional[str] = None):
+        """
+        Convert a column of amounts between currencies.
+        
+        Args:
+            column: Column holding the amounts
+            to: Code to convert to (defaults to the base currency)
+            from_col: Column holding each row's currency code
+            from_: Code all amounts are in, when from_col isn't given
+            to_col: Column holding each row's target currency code
+        
+        Example:
+            df['amt_eur'] = df.currency.convert('amt', to='EUR', from_col='ccy')
+        """
+        frame = self._frame
+        from_codes = frame[from_col] if from_col is not None else from_
+        to_codes = frame[to_col] if to_col is not None else to
+        return _convert_series(frame[column], from_codes, to_codes)
+
+
+def register_pandas_accessor():
+    """
+    Register the .currency accessor on pandas Series and DataFrames.
+    
+    Called automatically on import when pandas is already imported. Calling
+    it again is a no-op.
+    """
+    import pandas as pd
+    
+    # Registering twice makes pandas warn about overriding the accessor
+    if getattr(pd.Series, 'currency', None) is not _SeriesCurrencyAccessor:
+        pd.api.extensions.register_series_accessor('currency')(_SeriesCurrencyAccessor)
+    if getattr(pd.DataFrame, 'currency', None) is not _FrameCurrencyAccessor:
+        pd.api.extensions.register_dataframe_accessor('currency')(_FrameCurrencyAccessor)
+
+
+# ============================================================================
+# Command Line
+# ============================================================================
+
+# Arguments for _convert_chunk_rows in multiprocessing workers, set by _init_worker
+_worker_args = None
+
+
+def _init_worker(args: tuple):
+    global _worker_args
+    _worker_args = args
+
+
+def _convert_chunk(job: tuple) -> list:
+    first_row, chunk = job
+    return _convert_chunk_rows(chunk, first_row, *_worker_args)
+
+
+def _cli_convert(args) -> int:
+    if args.snapshot:
+        load_snapshot(args.snapshot)
+    if args.margin is not None:
+        set_margin(args.margin)
+    snap = _get_snapshot()
+    if args.save_snapshot:
+        save_snapshot(args.save_snapshot)
+    for code in (args.to, args.from_currency):
+        if code is not None and code.upper() not in snap.rates:
+            raise ValueError(f"Currency '{code}' not found")
+    
+    fmt = args.format
+    if fmt is None:
+        fmt = 'jsonl' if args.file and args.file.endswith(('.jsonl', '.ndjson')) else 'csv'
+    infile = open(args.file, newline='') if args.file else sys.stdin
+    outfile = open(args.output, 'w', newline='') if args.output else sys.stdout
+    
+    try:
+        if fmt == 'csv':
+            rows, write = _csv_io(infile, outfile, (args.column, args.currency_column), args.output_column)
+        else:
+            rows, write = _jsonl_io(infile, outfile)
+        
+        convert_args = (_pair_tables(snap), args.column, args.currency_column,
+                        args.from_currency, args.to.upper(), args.output_column)
+        start = time.perf_counter()
+        count = 0
+        if args.workers > 1:
+            import multiprocessing
+            
+            pending = deque()
+            with multiprocessing.Pool(args.workers, _init_worker, (convert_args,)) as pool:
+                for job in _chunks(rows, args.chunk_size):
+                    # Read ahead a bounded number of chunks, so memory doesn't grow with the input
+                    if len(pending) >= 2 * args.workers:
+                        count += _write_rows(pending.popleft().get(), write)
+                    pending.append(pool.apply_async(_convert_chunk, (job,)))
+                while pending:
+                    count += _write_rows(pending.popleft().get(), write)
+        else:
+            count = _write_rows(_convert_rows(rows, convert_args, args.chunk_size), write)
+        outfile.flush()
+        elapsed = time.perf_counter() - start
+    finally:
+        if args.file:
+            infile.close()
+        if args.output:
+            outfile.close()
+    
+    print(f"Converted {count:,} rows in {elapsed:.2f}s ({count / max(elapsed, 1e-9):,.0f} rows/s)",
+          file=sys.stderr)
+    return 0
+
+
+def main(argv: Optional[list] = None) -> int:
+    """
+    Command line entry point.
+    
+    Example:
+        currencyconsts convert --to EUR --column amount --currency-column ccy file.csv
+        cat file.jsonl | currencyconsts convert --to EUR --column amount --format jsonl
+    """
+    import argparse
+    
+    parser = argparse.ArgumentParser(prog='currencyconsts', description='Currency conversion tools.')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+    
+    convert = commands.add_parser('convert', help='convert a column of a CSV or JSON Lines file')
+    convert.add_argument('file', nargs='?', help='input file (default: stdin)')
+    convert.add_argument('--to', required=True, help='currency to convert to')
+    convert.add_argument('--column', required=True, help='column holding the amounts')
+    convert.add_argument('--currency-column', help="column holding each row's currency")
+    convert.add_argument('--from', dest='from_currency',
+                         help='currency of every amount without --currency-column (default: base)')
+    convert.add_argument('--output-column', help='write results here instead of replacing amounts')
+    convert.add_argument('--format', choices=['csv', 'jsonl'], help='default: from file extension, else csv')
+    convert.add_argument('-o', '--output', help='output file (default: stdout)')
+    convert.add_argument('--margin', type=float, help='margin percentage to apply')
+    convert.add_argument('--workers', type=int, default=1, help='processes converting chunks in parallel')
+    convert.add_argument('--chunk-size', type=int, default=10000, help='rows per chunk')
+    convert.add_argument('--snapshot', help='use rates from this snapshot file instead of fetching')
+    convert.add_argument('--save-snapshot', help='save the rates used to this file')
+    
+    snapshot = commands.add_parser('snapshot', help='save current rates to a snapshot file')
+    snapshot.add_argument('path')
+    snapshot.add_argument('--base', help='base currency of the saved rates')
+    
+    args = parser.parse_args(argv)
+    try:
+        if args.command == 'convert':
+            return _cli_convert(args)
+        if args.base:
+            set_base(args.base)
+        save_snapshot(args.path)
+        return 0
+    except (ValueError, KeyError, OSError, ConnectionError) as e:
+        print(f"currencyconsts: error: {e}", file=sys.stderr)
+        return 1
+
 
 # ============================================================================
 # Currency Constants - Dynamically Generated
@@ -282,6 +2274,63 @@ CURRENCY_CODES = [
     'MXN', 'BRL', 'ARS', 'CLP', 'COP', 'PEN', 'UYU',
 ]
 
-# Dynamically create currency constants
-for code in CURRENCY_CODES:
-    globals()[code] = Currency(code)
+# Active ISO 4217 codes by minor unit exponent, plus HRK which is kept for CURRENCY_CODES
+_ISO_4217_BY_EXPONENT = {
+    0: 'BIF CLP DJF GNF ISK JPY KMF KRW PYG RWF UGX UYI VND VUV XAF XOF XPF',
+    2: 'AED AFN ALL AMD ANG AOA ARS AUD AWG AZN BAM BBD BDT BGN BMD BND BOB BOV BRL BSD BTN '
+       'BWP BYN BZD CAD CDF CHE CHF CHW CNY COP COU CRC CUC CUP CVE CZK DKK DOP DZD EGP ERN '
+       'ETB EUR FJD FKP GBP GEL GHS GIP GMD GTQ GYD HKD HNL HRK HTG HUF IDR ILS INR IRR JMD '
+       'KES KGS KHR KPW KYD KZT LAK LBP LKR LRD LSL MAD MDL MGA MKD MMK MNT MOP MRU MUR MVR '
+       'MWK MXN MXV MYR MZN NAD NGN NIO NOK NPR NZD PAB PEN PGK PHP PKR PLN QAR RON RSD RUB '
+       'SAR SBD SCR SDG SEK SGD SHP SLE SLL SOS SRD SSP STN SVC SYP SZL THB TJS TMT TOP TRY '
+       'TTD TWD TZS UAH USD USN UYU UZS VED VES WST XCD XCG YER ZAR ZMW ZWG ZWL',
+    3: 'BHD IQD JOD KWD LYD OMR TND',
+    4: 'CLF UYW',
+}
+
+# Approximate USD rates bundled for offline use, as "CODE:rate" pairs
+_FALLBACK_AS_OF = '2025-08-01'
+_FALLBACK_RATES = """
+USD:1 EUR:0.86 GBP:0.745 JPY:147.5 CNY:7.17 CHF:0.80 AUD:1.53 CAD:1.37 NZD:1.68 HKD:7.85 SGD:1.28
+SEK:9.55 NOK:10.1 DKK:6.42 PLN:3.66 CZK:21.1 HUF:341 RON:4.36 BGN:1.68 HRK:6.48 RSD:100.8 ISK:122
+RUB:79.5 UAH:41.6 TRY:40.6
+INR:87.5 KRW:1385 THB:32.4 MYR:4.22 IDR:16300 PHP:57.0 VND:26200 TWD:29.9 PKR:283 BDT:122 LKR:301
+NPR:140 MMK:2100 KHR:4010
+AED:3.6725 SAR:3.75 ILS:3.37 EGP:48.6 ZAR:17.7 NGN:1530 KES:129.2 GHS:10.5 MAD:9.0 QAR:3.64
+KWD:0.305 BHD:0.376 OMR:0.3845 JOD:0.709
+MXN:18.7 BRL:5.45 ARS:1300 CLP:965 COP:4000 PEN:3.55 UYU:40.1
+"""
+
+_MINOR_UNITS = {
+    code: exponent
+    for exponent, codes in _ISO_4217_BY_EXPONENT.items()
+    for code in codes.split()
+}
+
+ISO_4217_CODES = sorted(_MINOR_UNITS)
+
+__all__ += CURRENCY_CODES
+
+
+def __getattr__(name: str):
+    """
+    Create currency constants like EUR on first access.
+    
+    Every ISO 4217 code is available (e.g. currencyconsts.XOF), but only
+    CURRENCY_CODES are exported by 'from currencyconsts import *'.
+    """
+    if name in _MINOR_UNITS:
+        currency = globals()[name] = Currency(name)
+        return currency
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()).union(_MINOR_UNITS))
+
+
+if 'pandas' in sys.modules:
+    register_pandas_accessor()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,8 +2,110 @@
 Test script to verify all currency conversions are working and non-zero.
 """
 
+import asyncio
+from contextlib import contextmanager
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import warnings
+from decimal import Decimal
+
+import currencyconsts
 from currencyconsts import *
 
+
+# ============================================================================
+# Fake HTTP transport for tests that must not touch the network
+# ============================================================================
+
+FAKE_RATES = {'USD': 1.0, 'EUR': 0.9, 'GBP': 0.8, 'JPY': 150.0}
+
+
+class FakeResponse:
+    def __init__(self, data=None, status_code=200, headers=None, content=b''):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(data).encode() if data is not None else content
+    
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise OSError(f"HTTP {self.status_code}")
+
+
+class FakeSession:
+    """
+    Stands in for requests.Session, serving FAKE_RATES for the base at the
+    end of the URL. Set fail, delay or respond to simulate slow or failing APIs;
+    fail and delay may also be callables taking the URL.
+    """
+    
+    def __init__(self, rates=None, delay=0, fail=False, headers=None):
+        self.rates = dict(rates or FAKE_RATES)
+        self.delay = delay
+        self.fail = fail
+        self.headers = headers or {}
+        self.respond = None  # Optional callable(url, headers) -> FakeResponse, or None for the default
+        self.calls = []
+        self._lock = threading.Lock()
+    
+    def get(self, url, timeout=None, headers=None):
+        with self._lock:
+            self.calls.append((url, dict(headers or {})))
+        delay = self.delay(url) if callable(self.delay) else self.delay
+        if delay:
+            time.sleep(delay)
+        fail = self.fail(url) if callable(self.fail) else self.fail
+        if fail:
+            raise OSError(f"{url} is down")
+        response = self.respond(url, headers or {}) if self.respond is not None else None
+        if response is not None:
+            return response
+        base = url.rsplit('/', 1)[-1].upper()
+        divisor = self.rates[base]
+        rates = {code: rate / divisor for code, rate in self.rates.items()}
+        return FakeResponse({'result': 'success', 'base_code': base, 'rates': rates}, headers=dict(self.headers))
+    
+    def close(self):
+        pass
+
+
+def assert_close(actual, expected, message=""):
+    """Assert sequences of floats match to within rounding error."""
+    actual, expected = list(actual), list(expected)
+    assert len(actual) == len(expected) and all(
+        abs(a - b) <= 1e-9 * max(abs(a), abs(b), 1) for a, b in zip(actual, expected)
+    ), f"{message} {actual} != {expected}"
+
+
+@contextmanager
+def fake_api(session=None, **config):
+    """Run with session as the HTTP transport, empty caches and config overrides."""
+    session = session or FakeSession()
+    saved_config = dict(currencyconsts._config)
+    
+    def reset():
+        with currencyconsts._lock:
+            currencyconsts._snapshots.clear()
+            currencyconsts._snapshot = None
+        with currencyconsts._breaker_lock:
+            currencyconsts._breakers.clear()
+        currencyconsts._validated.clear()
+    
+    reset()
+    currencyconsts._config.update(config)
+    set_session(session)
+    try:
+        yield session
+    finally:
+        set_session(None)
+        currencyconsts._config.clear()
+        currencyconsts._config.update(saved_config)
+        reset()
+
+
 def test_conversions():
     """Test basic currency conversions."""
     print("=" * 60)
@@ -148,20 +250,691 @@ def test_base_currency():
     print("\n✓ BASE CURRENCY CHANGES WORKING!")
 
 
+def test_pivot_currency():
+    """Test that other bases are derived from the pivot table without fetching."""
+    print("\n" + "=" * 60)
+    print("TESTING PIVOT CURRENCY AND CROSS RATES")
+    print("=" * 60)
+    
+    with fake_api() as session:
+        assert 100 * EUR == 90.0
+        set_base('EUR')
+        assert_close([100 * USD], [100 / 0.9], "EUR base not derived from the pivot!")
+        set_base('GBP')
+        assert_close([100 * EUR], [100 * 0.9 / 0.8])
+        assert len(session.calls) == 1, f"Expected 1 fetch, got {len(session.calls)}"
+        
+        rates = currencyconsts._get_rates()
+        matrix = cross_rate_matrix(['USD', 'EUR', 'JPY'])
+        for a, row in matrix.items():
+            for b, rate in row.items():
+                assert rate == rates[b] / rates[a], f"{a}->{b} is {rate}"
+        assert_close([cross_rate('EUR', 'JPY')], [150.0 / 0.9])
+        assert cross_rate_matrix(['USD', 'EUR', 'JPY']) is matrix, "Matrix was not reused!"
+        assert len(session.calls) == 1
+    
+    print("\n✓ PIVOT CURRENCY WORKING!")
+
+
+def test_margin_consistency():
+    """Test that batch conversions charge the same margins as the operators."""
+    print("\n" + "=" * 60)
+    print("TESTING MARGINS ACROSS CONVERSION PATHS")
+    print("=" * 60)
+    
+    with fake_api():
+        try:
+            set_margin(5, direction='sell')
+            assert_close(convert_many_pairs([100], 'EUR', 'USD'), [100 / EUR], "Sell margin ignored!")
+            assert_close(convert_many_pairs([100], 'EUR', None), [100 / EUR], "Sell margin ignored!")
+            
+            set_margin(5)
+            assert_close(convert_many_pairs([100], None, 'EUR'), [100 * EUR])
+            # Between two other currencies both margins apply, none to the same currency
+            assert_close(convert_many_pairs([100, 100], 'EUR', ['GBP', 'eur']),
+                         [100 / 0.9 / (1 / 0.95) * 0.8 * 0.95, 100.0])
+            rows = list(convert_stream([{'amt': 100, 'ccy': 'EUR'}], 'amt', 'ccy', 'EUR'))
+            assert rows[0]['amt'] == 100.0, "Same-currency conversion charged a margin!"
+            assert Money.of(100, 'EUR').to('GBP') == Money.of(100 / 0.9 * 0.95 * 0.8 * 0.95, 'GBP')
+            
+            # Clearing an override inherits the global margin again and frees old tables
+            set_margin(0, 'JPY', direction='both')
+            assert_close([100 * JPY], [100 * 150.0])
+            stale_key = currencyconsts._margin_key
+            set_margin(None, 'JPY', direction='both')
+            assert 'JPY' not in currencyconsts._config['currency_margins'], "Override not cleared!"
+            assert_close([100 * JPY], [100 * 150.0 * 0.95])
+            assert not [key for key in currencyconsts._snapshot.derived
+                        if isinstance(key, tuple) and key[-1] == stale_key], "Old margin tables kept!"
+            try:
+                set_margin(None)
+                assert False, "Global margin cleared!"
+            except ValueError:
+                pass
+        finally:
+            set_margin(0)
+            set_margin(0, direction='sell')
+    
+    print("\n✓ MARGINS CONSISTENT!")
+
+
+def test_money():
+    """Test exact minor-unit arithmetic of Money."""
+    print("\n" + "=" * 60)
+    print("TESTING MONEY ARITHMETIC")
+    print("=" * 60)
+    
+    price = Money.of(19.99, 'EUR')
+    assert price.minor == 1999, "Money.of did not convert to minor units!"
+    assert price * 3 == Money(5997, EUR), "Integer scaling is not exact!"
+    assert sum([price] * 10) == Money(19990, EUR), "sum() of Money drifted!"
+    assert sum_money([price] * 10) == Money(19990, EUR), "sum_money() drifted!"
+    assert money_from_amounts([0.1] * 10, 'USD') == Money(100, USD), "Float amounts drifted!"
+    
+    # Banker's rounding at each currency's minor unit exponent
+    assert Money.of(0.125, 'USD').minor == 12, "Half did not round to even!"
+    assert Money.of(0.135, 'USD').minor == 14, "Half did not round to even!"
+    assert Money.of(1.5, 'JPY').minor == 2, "JPY should have no minor units!"
+    assert Money.of(1, 'KWD').minor == 1000, "KWD should have 3 minor units!"
+    assert Money.of(1.015, 'USD') == Money.of(Decimal('1.015'), 'USD') == Money(102, USD), \
+        "Float ties should round like their decimal value!"
+    assert money_from_amounts([1.015, 1.025], 'USD') == Money(204, USD)
+    assert Money(1015, USD) / 10 == Money(102, USD)
+    print(f"  {price} * 3 = {price * 3}")
+    
+    try:
+        price + Money.of(1, 'USD')
+        assert False, "Adding different currencies should fail!"
+    except ValueError:
+        pass
+    try:
+        price < 5
+        assert False, "Comparing Money with a number should fail!"
+    except TypeError:
+        pass
+    
+    print("\n✓ MONEY ARITHMETIC IS EXACT!")
+
+
+def test_decimal_conversions():
+    """Test that Decimal amounts convert to Decimal, exactly in decimal mode."""
+    print("\n" + "=" * 60)
+    print("TESTING DECIMAL CONVERSIONS")
+    print("=" * 60)
+    
+    with fake_api() as session:
+        result = Decimal('100') * EUR
+        assert isinstance(result, Decimal) and result == Decimal('90'), result
+        assert isinstance(Decimal('90') / EUR, Decimal)
+        assert isinstance(100 * EUR, float), "Float conversions should stay float!"
+        
+        # More digits than a float holds survive in decimal mode
+        payload = b'{"rates": {"USD": 1, "EUR": 0.92345678901234567891}}'
+        session.respond = lambda url, headers: FakeResponse(content=payload)
+        set_decimal_mode(True)
+        refresh_rates()
+        assert Decimal('100') * EUR == Decimal('92.345678901234567891'), Decimal('100') * EUR
+        assert 100 * EUR == 92.34567890123457
+    
+    print("\n✓ DECIMAL CONVERSIONS EXACT!")
+
+
+def test_offline_mode():
+    """Test conversions from the bundled fallback rates."""
+    print("\n" + "=" * 60)
+    print("TESTING OFFLINE MODE")
+    print("=" * 60)
+    
+    with fake_api() as session:
+        set_offline_mode(True)
+        try:
+            for code, currency in [('EUR', EUR), ('JPY', JPY), ('KWD', KWD)]:
+                result = 100 * currency
+                assert result > 0, f"{code} fallback conversion failed!"
+                print(f"  100 USD = {result:.2f} {code}")
+            assert rate_status()['using_fallback'], "Fallback rates were not reported!"
+            assert session.calls == [], "Offline mode used the network!"
+        finally:
+            set_offline_mode(False)
+        assert not rate_status()['using_fallback'], "Fallback status outlived offline mode!"
+    
+    # Failed fetches without cached rates fall back, with a warning
+    import warnings
+    currencyconsts._fallback_warned = False
+    with fake_api(FakeSession(fail=True)) as session, warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        assert 100 * EUR == 100 * currencyconsts._fallback_rates('USD')['EUR']
+        assert rate_status()['using_fallback']
+        assert [w.category for w in caught] == [RuntimeWarning], caught
+        
+        session.fail = False
+        refresh_rates()
+        assert 100 * EUR == 90.0 and not rate_status()['using_fallback']
+    
+    print("\n✓ OFFLINE MODE WORKING!")
+
+
+def test_rate_cache():
+    """Test that rate tables are cached per base and evicted least recently used first."""
+    print("\n" + "=" * 60)
+    print("TESTING RATE CACHE")
+    print("=" * 60)
+    
+    with fake_api(pivot_currency=None, cache_max_bases=1) as session:
+        assert 100 * EUR == 90.0
+        assert 100 * GBP == 80.0
+        assert len(session.calls) == 1, "Cached rates were fetched again!"
+        
+        set_base('EUR')
+        assert_close([100 * USD], [100 / 0.9])
+        assert list(currencyconsts._snapshots) == ['EUR'], "USD table was not evicted!"
+        set_base('USD')
+        assert 100 * EUR == 90.0
+        assert len(session.calls) == 3, "Evicted USD table was not fetched again!"
+        
+        # Switching back to a cached base reuses its table
+        set_cache_size(2)
+        set_base('EUR')
+        assert_close([100 * USD], [100 / 0.9])
+        set_base('USD')
+        assert 100 * EUR == 90.0
+        assert len(session.calls) == 4, "Cached base was fetched again!"
+        assert list(currencyconsts._snapshots) == ['EUR', 'USD']
+    
+    print("\n✓ RATE CACHE WORKING!")
+
+
+def test_disk_cache():
+    """Test sharing fetched rates through files on disk."""
+    print("\n" + "=" * 60)
+    print("TESTING DISK CACHE")
+    print("=" * 60)
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        path = os.path.join(cache_dir, 'rates-USD.json')
+        with fake_api(disk_cache_dir=cache_dir) as session:
+            assert 100 * EUR == 90.0
+            assert len(session.calls) == 1
+            assert os.listdir(cache_dir) == ['rates-USD.json'], "Temporary file left behind!"
+        
+        # A fresh file is used without any request
+        with fake_api(disk_cache_dir=cache_dir) as session:
+            assert 100 * EUR == 90.0
+            assert session.calls == [], "Fresh disk cache was not used!"
+        
+        # Expired and corrupt files are ignored
+        with open(path) as f:
+            data = json.load(f)
+        data['fetched_at'] -= 2 * 60 * 60
+        data['expires_at'] = data['fetched_at'] + 60
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        with fake_api(disk_cache_dir=cache_dir) as session:
+            assert 100 * EUR == 90.0
+            assert len(session.calls) == 1, "Expired disk cache was used!"
+        
+        with open(path, 'w') as f:
+            f.write('{"rates": {"EUR"')
+        with fake_api(disk_cache_dir=cache_dir) as session:
+            assert 100 * EUR == 90.0
+            assert len(session.calls) == 1, "Corrupt disk cache was used!"
+        assert os.listdir(cache_dir) == ['rates-USD.json'], "Temporary file left behind!"
+    
+    print("\n✓ DISK CACHE WORKING!")
+
+
+def _age_snapshot(seconds):
+    """Make the current snapshot look fetched seconds ago and already expired."""
+    with currencyconsts._lock:
+        snap = currencyconsts._snapshot
+        currencyconsts._store(snap._replace(fetched_at=time.time() - seconds, expires_at=time.time() - 1))
+
+
+def test_stale_while_revalidate():
+    """Test serving expired rates while a background refresh runs."""
+    print("\n" + "=" * 60)
+    print("TESTING STALE-WHILE-REVALIDATE")
+    print("=" * 60)
+    
+    with fake_api(stale_while_revalidate=True, hard_expiry_minutes=60) as session:
+        assert 100 * EUR == 90.0
+        session.rates['EUR'] = 0.95
+        session.delay = 0.2
+        
+        # Expired but within the hard expiry: stale rates without waiting
+        _age_snapshot(5 * 60)
+        start = time.perf_counter()
+        assert 100 * EUR == 90.0, "Stale rates were not served!"
+        assert time.perf_counter() - start < 0.1, "Stale read waited on the refresh!"
+        with currencyconsts._background_lock:
+            pass  # Wait for the background refresh
+        assert 100 * EUR == 95.0, "Background refresh did not publish!"
+        
+        # Past the hard expiry callers block on the refresh
+        session.rates['EUR'] = 0.8
+        _age_snapshot(2 * 60 * 60)
+        assert 100 * EUR == 80.0, "Rates past the hard expiry were served!"
+        assert len(session.calls) == 3
+    
+    print("\n✓ STALE-WHILE-REVALIDATE WORKING!")
+
+
+def test_fetch_modes():
+    """Test racing and hedging requests across endpoints."""
+    print("\n" + "=" * 60)
+    print("TESTING FETCH MODES")
+    print("=" * 60)
+    
+    endpoints = ['https://slow.test/{BASE}', 'https://fast.test/{BASE}']
+    session = FakeSession(delay=lambda url: 0.5 if 'slow' in url else 0)
+    
+    with fake_api(session, api_endpoints=endpoints, adaptive_endpoints=False, fetch_mode='race'):
+        start = time.perf_counter()
+        assert 100 * EUR == 90.0
+        assert time.perf_counter() - start < 0.4, "Race waited on the slow endpoint!"
+        assert {url.split('/')[2] for url, _ in session.calls} == {'slow.test', 'fast.test'}
+    
+    session.calls.clear()
+    with fake_api(session, api_endpoints=endpoints, adaptive_endpoints=False,
+                  fetch_mode='hedged', hedge_delay=0.05):
+        start = time.perf_counter()
+        assert 100 * EUR == 90.0
+        assert time.perf_counter() - start < 0.4, "Hedge was not sent!"
+        assert [url.split('/')[2] for url, _ in session.calls] == ['slow.test', 'fast.test']
+    
+    # A failed request is replaced at once rather than after the hedge delay
+    session = FakeSession(fail=lambda url: 'slow' in url)
+    with fake_api(session, api_endpoints=endpoints, adaptive_endpoints=False,
+                  fetch_mode='hedged', hedge_delay=5):
+        start = time.perf_counter()
+        assert 100 * EUR == 90.0
+        assert time.perf_counter() - start < 1, "Failed request was not replaced!"
+        assert len(session.calls) == 2
+    
+    # HTTP options never replace a session installed with set_session()
+    with fake_api(session):
+        set_http_options(pool_size=4, retries=1)
+        assert currencyconsts._get_session() is session, "Custom session was replaced!"
+    
+    print("\n✓ FETCH MODES WORKING!")
+
+
+def test_adaptive_endpoints():
+    """Test that endpoints are tried cheapest first by observed latency and errors."""
+    print("\n" + "=" * 60)
+    print("TESTING ADAPTIVE ENDPOINT ORDER")
+    print("=" * 60)
+    
+    down, up = 'https://down.test/{BASE}', 'https://up.test/{BASE}'
+    session = FakeSession(fail=lambda url: 'down' in url)
+    with fake_api(session, api_endpoints=[down, up]):
+        assert currencyconsts._config['adaptive_endpoints'], "Adaptive order is not the default!"
+        assert 100 * EUR == 90.0
+        assert [url.split('/')[2] for url, _ in session.calls] == ['down.test', 'up.test']
+        
+        # The failed endpoint now costs more, so the healthy one is tried first
+        session.calls.clear()
+        for _ in range(3):
+            refresh_rates()
+        assert [url.split('/')[2] for url, _ in session.calls] == ['up.test'] * 3, "Failed endpoint tried first!"
+        
+        stats = endpoint_stats()
+        assert list(stats) == [up, down], "Stats not ordered cheapest first!"
+        assert stats[up]['requests'] == 4 and stats[up]['errors'] == 0 and stats[up]['error_rate'] == 0.0
+        assert stats[down]['requests'] == 1 and stats[down]['errors'] == 1
+        assert stats[down]['error_rate'] == currencyconsts._CircuitBreaker.ALPHA
+    
+    print("\n✓ ADAPTIVE ENDPOINT ORDER WORKING!")
+
+
+def test_single_flight():
+    """Test that concurrent cache misses share one fetch."""
+    print("\n" + "=" * 60)
+    print("TESTING SINGLE-FLIGHT FETCHES")
+    print("=" * 60)
+    
+    threads = 20
+    with fake_api(FakeSession(delay=0.2)) as session:
+        before = fetch_stats()
+        barrier = threading.Barrier(threads)
+        results = []
+        
+        def convert():
+            barrier.wait()
+            results.append(100 * EUR)
+        
+        workers = [threading.Thread(target=convert) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        
+        after = fetch_stats()
+        assert results == [90.0] * threads
+        assert len(session.calls) == 1, f"{len(session.calls)} fetches for one miss!"
+        assert after['executions'] - before['executions'] == 1
+        assert after['coalesced'] - before['coalesced'] == threads - 1
+    
+    print(f"\n✓ {threads} CALLERS SHARED ONE FETCH!")
+
+
+def test_async_api():
+    """Test that concurrent async lookups share one fetch and the sync cache."""
+    print("\n" + "=" * 60)
+    print("TESTING ASYNC API")
+    print("=" * 60)
+    
+    async def run(session):
+        results = await asyncio.gather(*(aget_rates() for _ in range(10)))
+        assert len(session.calls) == 1, f"Expected 1 fetch, got {len(session.calls)}"
+        assert all(rates is results[0] for rates in results)
+        
+        assert await aconvert(100, 'EUR') == 100 * EUR
+        assert len(session.calls) == 1, "aconvert did not reuse the cache!"
+        
+        await arefresh_rates()
+        assert len(session.calls) == 2, "arefresh_rates did not refetch!"
+        
+        set_money_mode(True)
+        money = await aconvert(100, 'EUR')
+        assert isinstance(money, Money) and money == 100 * EUR
+    
+    with fake_api(FakeSession(delay=0.2)) as session:
+        asyncio.run(run(session))
+    
+    print("\n✓ ASYNC API WORKING!")
+
+
+def test_convert_array():
+    """Test vectorized conversion with NumPy."""
+    print("\n" + "=" * 60)
+    print("TESTING CONVERT_ARRAY")
+    print("=" * 60)
+    
+    try:
+        import numpy as np
+    except ImportError:
+        print("\n  NumPy not installed, skipped")
+        return
+    
+    with fake_api():
+        result = convert_array([100, 250], ['EUR', 'GBP'], 'JPY')
+        assert np.allclose(result, [100 / 0.9 * 150, 250 / 0.8 * 150]), result
+        assert np.allclose(convert_array([90], 'EUR'), [100]), "Target should default to the base!"
+        
+        set_margin(5)
+        try:
+            assert np.allclose(convert_array([100, 100], 'EUR', ['EUR', 'USD']), [100, 100 / 0.9]), \
+                "Margin charged on a same-currency or base conversion!"
+        finally:
+            set_margin(0)
+        
+        indices = np.array([CURRENCY_CODES.index('EUR'), CURRENCY_CODES.index('GBP')])
+        assert np.allclose(convert_array([100, 250], indices, CURRENCY_CODES.index('JPY')), result)
+        
+        for codes in (np.array([-1]), np.array([10 ** 6]), ['XXX']):
+            try:
+                convert_array([100], codes, 'USD')
+                assert False, f"{codes} should be rejected!"
+            except ValueError:
+                pass
+    
+    print("\n✓ CONVERT_ARRAY WORKING!")
+
+
+def test_pandas_accessor():
+    """Test the .currency accessor on Series and DataFrames."""
+    print("\n" + "=" * 60)
+    print("TESTING PANDAS ACCESSOR")
+    print("=" * 60)
+    
+    try:
+        import pandas as pd
+    except ImportError:
+        print("\n  pandas not installed, skipped")
+        return
+    register_pandas_accessor()
+    # Registering again must not warn about overriding the accessor
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        register_pandas_accessor()
+    
+    with fake_api():
+        df = pd.DataFrame({'amt': [90.0, 80.0, 100.0], 'ccy': ['EUR', 'gbp', 'USD']})
+        converted = df.currency.convert('amt', to='JPY', from_col='ccy')
+        assert_close(converted, [15000.0, 15000.0, 15000.0])
+        assert converted.index.equals(df.index)
+        
+        assert_close(df['amt'].currency.convert(from_='EUR'), [100.0, 80 / 0.9, 100 / 0.9])
+        assert_close(df['amt'].currency.convert(to=df['ccy']), [81.0, 64.0, 100.0])
+        
+        bad = pd.DataFrame({'amt': [1.0, 2.0], 'ccy': ['EUR', 'XXX']})
+        try:
+            bad.currency.convert('amt', from_col='ccy')
+            assert False, "Unknown codes should be rejected!"
+        except ValueError as e:
+            assert 'XXX' in str(e)
+    
+    print("\n✓ PANDAS ACCESSOR WORKING!")
+
+
+def test_convert_stream():
+    """Test streaming conversion of rows, CSV and JSON Lines."""
+    print("\n" + "=" * 60)
+    print("TESTING STREAMING CONVERSION")
+    print("=" * 60)
+    
+    with fake_api() as session:
+        rows = ({'amount': 90, 'ccy': 'EUR'} for _ in range(3))
+        stream = convert_stream(rows, 'amount', 'ccy', 'USD', chunk_size=1)
+        first = next(stream)
+        
+        # Rates refreshed mid-stream don't affect the rest of it
+        session.rates['EUR'] = 0.5
+        refresh_rates()
+        assert 90 / EUR == 180.0
+        rest = list(stream)
+        assert_close([row['amount'] for row in [first] + rest], [100.0] * 3, "Snapshot was not pinned!")
+        assert all(row['ccy'] == 'USD' for row in [first] + rest)
+        
+        rows = convert_stream([{'amount': '100'}], 'amount', None, 'JPY', output_field='jpy', source='EUR')
+        row = next(rows)
+        assert row['amount'] == '100', "output_field should keep the amount!"
+        assert_close([row['jpy']], [100 / 0.5 * 150])
+        
+        out = io.StringIO()
+        assert convert_csv(io.StringIO("amount,ccy\n50,EUR\n80,GBP\n"), out, 'amount', 'ccy', 'USD',
+                           output_field='usd') == 2
+        assert out.getvalue().splitlines() == ['amount,ccy,usd', '50,EUR,100.0', '80,GBP,100.0']
+        
+        out = io.StringIO()
+        assert convert_jsonl(io.StringIO('{"amount": 50}\n\n{"amount": 25}\n'), out, 'amount', None, 'USD',
+                             source='EUR') == 2
+        assert [json.loads(line)['amount'] for line in out.getvalue().splitlines()] == [100.0, 50.0]
+    
+    print("\n✓ STREAMING CONVERSION WORKING!")
+
+
+def test_command_line():
+    """Test the convert command, with and without worker processes."""
+    print("\n" + "=" * 60)
+    print("TESTING COMMAND LINE")
+    print("=" * 60)
+    
+    with tempfile.TemporaryDirectory() as tmp, fake_api():
+        infile, outfile = os.path.join(tmp, 'in.csv'), os.path.join(tmp, 'out.csv')
+        with open(infile, 'w') as f:
+            f.write('amt,ccy\n' + '90,EUR\n' * 50)
+        
+        for workers in ('1', '2'):
+            assert currencyconsts.main(['convert', infile, '-o', outfile, '--to', 'JPY', '--column', 'amt',
+                         '--currency-column', 'ccy', '--chunk-size', '7', '--workers', workers]) == 0
+            with open(outfile) as f:
+                lines = f.read().splitlines()
+            assert lines[0] == 'amt,ccy' and len(lines) == 51
+            assert_close([float(line.split(',')[0]) for line in lines[1:]], [15000.0] * 50)
+        
+        # Bad columns are reported before anything is written
+        os.remove(outfile)
+        assert currencyconsts.main(['convert', infile, '-o', outfile, '--to', 'JPY', '--column', 'amount']) == 1
+        with open(outfile) as f:
+            assert f.read() == '', "Output written for a missing column!"
+        
+        with open(infile, 'a') as f:
+            f.write(',EUR\n')
+        try:
+            with open(infile) as f:
+                convert_csv(f, io.StringIO(), 'amt', 'ccy', 'USD')
+            assert False, "Empty amount should fail!"
+        except ValueError as e:
+            assert str(e) == "Row 51: invalid amount '' in 'amt'", e
+    
+    print("\n✓ COMMAND LINE WORKING!")
+
+
+def test_circuit_breaker():
+    """Test skipping failing endpoints and serving the last good rates."""
+    print("\n" + "=" * 60)
+    print("TESTING CIRCUIT BREAKER")
+    print("=" * 60)
+    
+    endpoint = 'https://rates.test/{BASE}'
+    with fake_api(api_endpoints=[endpoint], breaker_threshold=2, breaker_backoff=60) as session:
+        breaker = lambda: currencyconsts._breakers[endpoint]
+        assert 100 * EUR == 90.0
+        
+        # Opens after breaker_threshold consecutive failures
+        session.fail = True
+        refresh_rates()
+        assert breaker().state == 'closed'
+        refresh_rates()
+        assert breaker().state == 'open' and len(session.calls) == 3
+        assert time.time() + 29 < breaker().retry_at <= time.time() + 60, "Backoff out of range!"
+        
+        # The last good rates are served until an endpoint may be retried
+        assert 100 * EUR == 90.0, "Last good rates were not served!"
+        assert currencyconsts._snapshot.expires_at >= breaker().retry_at
+        assert not rate_status()['using_fallback']
+        
+        # While open, fetches fail without touching the network
+        try:
+            currencyconsts._fetch_rates('USD')
+            assert False, "Fetch with every breaker open should fail!"
+        except ConnectionError:
+            pass
+        refresh_rates()
+        assert len(session.calls) == 3, "Open breaker let a request through!"
+        
+        # A failed half-open trial reopens with a longer backoff
+        breaker().retry_at = 0
+        refresh_rates()
+        assert breaker().state == 'open' and breaker().opened == 2 and len(session.calls) == 4
+        assert breaker().retry_at > time.time() + 59
+        
+        # A successful half-open trial closes it
+        breaker().retry_at = 0
+        session.fail = False
+        session.rates['EUR'] = 0.95
+        refresh_rates()
+        assert breaker().state == 'closed' and breaker().failures == 0
+        assert 100 * EUR == 95.0
+    
+    print("\n✓ CIRCUIT BREAKER WORKING!")
+
+
+def test_conditional_requests():
+    """Test ETag revalidation and provider expiry hints."""
+    print("\n" + "=" * 60)
+    print("TESTING CONDITIONAL REQUESTS")
+    print("=" * 60)
+    
+    endpoint = 'https://rates.test/{BASE}'
+    session = FakeSession(headers={'ETag': '"v1"'})
+    session.respond = lambda url, headers: (
+        FakeResponse(status_code=304, headers={'Cache-Control': 'max-age=7200'})
+        if headers.get('If-None-Match') == '"v1"' else None
+    )
+    with fake_api(session, api_endpoints=[endpoint]):
+        assert 100 * EUR == 90.0
+        assert session.calls[-1][1] == {}
+        validated = currencyconsts._validated['https://rates.test/USD']
+        
+        # A 304 reuses the validated rates and extends their expiry
+        refresh_rates()
+        assert session.calls[-1][1] == {'If-None-Match': '"v1"'}
+        assert currencyconsts._snapshot.rates is validated.rates, "304 did not reuse the rates!"
+        assert currencyconsts._snapshot.expires_at > time.time() + 7100, "304 did not extend the expiry!"
+        
+        # A shorter TTL does not cut the provider expiry short
+        ttl = currencyconsts._config['cache_ttl_minutes']
+        set_cache_ttl(1)
+        assert currencyconsts._snapshot.expires_at > time.time() + 7100, "TTL change dropped the provider expiry!"
+        set_cache_ttl(ttl)
+        
+        # Rates parsed in the other mode are not reused
+        set_decimal_mode(True)
+        refresh_rates()
+        assert session.calls[-1][1] == {}, "Float rates revalidated in decimal mode!"
+    
+    expiry = currencyconsts._provider_expiry
+    now = time.time()
+    assert abs(expiry({'Cache-Control': 'public, max-age=600', 'Age': '100'}, None) - (now + 500)) < 5
+    assert expiry({'Cache-Control': 'max-age=60'}, now + 3600) == now + 3600
+    assert expiry({'Cache-Control': 'no-cache'}, now + 3600) is None
+    assert expiry({'Cache-Control': 'max-age=soon'}, None) is None
+    assert expiry({}, now + 3600) == now + 3600
+    
+    print("\n✓ CONDITIONAL REQUESTS WORKING!")
+
+
+def test_json_decoding():
+    """Test response decoding and the choice of JSON decoder."""
+    print("\n" + "=" * 60)
+    print("TESTING JSON DECODING")
+    print("=" * 60)
+    
+    parse = currencyconsts._parse_api_response
+    url = 'https://rates.test/USD'
+    rates = {'USD': 1.0, 'EUR': 0.9}
+    assert parse({'rates': rates}, 'USD', url) is rates, "Upper case rates were copied!"
+    lower = {'usd': 1.0, 'eur': 0.9}
+    parsed = parse({'usd': lower}, 'USD', url)
+    assert parsed == rates and parsed is not lower
+    assert lower == {'usd': 1.0, 'eur': 0.9}, "Response dict was modified!"
+    
+    decoded = []
+    
+    def loads(content):
+        decoded.append(content)
+        return json.loads(content)
+    
+    with fake_api():
+        set_json_decoder(loads)
+        try:
+            assert 100 * EUR == 90.0
+        finally:
+            set_json_decoder(None)
+        assert len(decoded) == 1, "Custom decoder was not used!"
+        assert isinstance(decoded[0], bytes) and json.loads(decoded[0])['base_code'] == 'USD'
+    
+    print("\n✓ JSON DECODING WORKING!")
+
+
 def test_api_status():
     """Check API status and fallback."""
     print("\n" + "=" * 60)
     print("API STATUS")
     print("=" * 60)
     
-    from currencyconsts import _config, _cache
-    print(f"\nUsing fallback rates: {_cache.get('using_fallback', False)}")
+    from currencyconsts import _config
+    using_fallback = rate_status()['using_fallback']
+    print(f"\nUsing fallback rates: {using_fallback}")
     print(f"Cache TTL: {_config['cache_ttl_minutes']} minutes")
     print(f"Base currency: {_config['base_currency'].upper()}")
     print(f"Margin: {_config['margin_percent']}%")
     print(f"Offline mode: {_config.get('offline_mode', False)}")
     
-    if _cache.get('using_fallback'):
+    if using_fallback:
         print("\n⚠ Using fallback rates (network unavailable or API error)")
     else:
         print("\n✓ Using live rates from API")
@@ -179,6 +952,25 @@ if __name__ == '__main__':
         test_conversions()
         test_margin()
         test_base_currency()
+        test_pivot_currency()
+        test_margin_consistency()
+        test_money()
+        test_decimal_conversions()
+        test_offline_mode()
+        test_rate_cache()
+        test_disk_cache()
+        test_stale_while_revalidate()
+        test_fetch_modes()
+        test_adaptive_endpoints()
+        test_single_flight()
+        test_async_api()
+        test_convert_array()
+        test_pandas_accessor()
+        test_convert_stream()
+        test_command_line()
+        test_circuit_breaker()
+        test_conditional_requests()
+        test_json_decoding()
         
         print("\n" + "*" * 60)
         print("  ALL TESTS PASSED! ✓")